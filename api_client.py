@@ -1,45 +1,251 @@
 import aiohttp
+import asyncio
+import contextvars
 import random
 import json
+import time
 from config import Config
+import color_math
+import metrics
+from cache import RefreshingCache
+from palette_generator import PaletteGenerator
+from palette_store import PaletteSnapshot
+from prefetch import PalettePrefetcher
+from resilience import CircuitBreaker, LatencyTracker, TokenBucket
+
+# Момент (time.monotonic), когда кончается бюджет времени текущего источника.
+# Его задает _run_source, а fetch_json ограничивает им таймаут запроса, чтобы запрос
+# завершился своим таймаутом (и был учтен), а не был молча отменен снаружи
+_source_deadline = contextvars.ContextVar('source_deadline', default=None)
+
+# Запас между таймаутом запроса и отменой источника снаружи
+_DEADLINE_GRACE = 0.1
 
 class ColorAPIClient:
     """Клиент для получения цветов из работающих API"""
     
-    # Кэш для палитр
-    _palettes_cache = None
+    # Кэш для палитр (TTL, фоновое обновление, одна загрузка на всех)
+    _palettes_cache = RefreshingCache(
+        lambda: ColorAPIClient._load_color_palettes(),
+        ttl=Config.PALETTES_TTL,
+        stale_ttl=Config.PALETTES_STALE_TTL,
+        retry_backoff=Config.PALETTES_RETRY_BACKOFF,
+        retry_backoff_max=Config.PALETTES_RETRY_BACKOFF_MAX
+    )
+    _snapshot_checked = False
+    metrics.register_cache("palettes", _palettes_cache)
+    
+    # Пулы заранее полученных палитр Colormind
+    _prefetcher = None
+    
+    # Локальный генератор палитр (создается при первом обращении)
+    _generator = None
+    
+    # Предохранители и статистика задержек по источникам
+    _breakers = {}
+    _latencies = {}
+    # Общие лимиты частоты запросов к источникам (на всех пользователей)
+    _limiters = {}
+    
+    # Общая HTTP-сессия с пулом соединений
+    _session = None
+    
+    @staticmethod
+    async def start_session():
+        """Создать общую HTTP-сессию (keep-alive, кэш DNS, лимиты на хост)"""
+        if ColorAPIClient._session is None or ColorAPIClient._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=Config.HTTP_POOL_LIMIT,
+                limit_per_host=Config.HTTP_LIMIT_PER_HOST,
+                ttl_dns_cache=Config.HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=Config.HTTP_KEEPALIVE_TIMEOUT
+            )
+            ColorAPIClient._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=Config.HTTP_TIMEOUT)
+            )
+        return ColorAPIClient._session
+    
+    @staticmethod
+    async def close_session():
+        """Закрыть общую HTTP-сессию"""
+        if ColorAPIClient._session is not None and not ColorAPIClient._session.closed:
+            await ColorAPIClient._session.close()
+        ColorAPIClient._session = None
+    
+    @staticmethod
+    def start_prefetch():
+        """Запустить фоновое пополнение пулов палитр по тематикам"""
+        if not Config.PREFETCH_ENABLED or ColorAPIClient._prefetcher is not None:
+            return
+        ColorAPIClient._prefetcher = PalettePrefetcher(
+            ColorAPIClient.get_random_palette_from_colormind,
+            Config.THEMES,
+            pool_size=Config.PREFETCH_POOL_SIZE,
+            concurrency=Config.PREFETCH_CONCURRENCY,
+            rate_per_sec=Config.PREFETCH_RATE_PER_SEC,
+            retry_delay=Config.PREFETCH_RETRY_DELAY
+        )
+        ColorAPIClient._prefetcher.start()
+        metrics.register_cache("prefetch", ColorAPIClient._prefetcher)
+    
+    @staticmethod
+    async def stop_prefetch():
+        """Остановить фоновое пополнение пулов"""
+        if ColorAPIClient._prefetcher is not None:
+            await ColorAPIClient._prefetcher.stop()
+            ColorAPIClient._prefetcher = None
+    
+    @staticmethod
+    def _get_breaker(source: str):
+        """Предохранитель для источника (создается при первом обращении)"""
+        breaker = ColorAPIClient._breakers.get(source)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failure_rate=Config.BREAKER_FAILURE_RATE,
+                min_requests=Config.BREAKER_MIN_REQUESTS,
+                window=Config.BREAKER_WINDOW,
+                open_seconds=Config.BREAKER_OPEN_SECONDS
+            )
+            ColorAPIClient._breakers[source] = breaker
+        return breaker
+    
+    @staticmethod
+    def _get_limiter(source: str):
+        """Лимит частоты источника (None - без ограничения)"""
+        if source not in ColorAPIClient._limiters:
+            rate, burst = Config.SOURCE_RATE_LIMITS.get(source, (0, 0))
+            ColorAPIClient._limiters[source] = TokenBucket(rate, max(burst, 1)) if rate > 0 else None
+        return ColorAPIClient._limiters[source]
+    
+    @staticmethod
+    async def _wait_turn(source: str):
+        """Дождаться своей очереди к источнику; False - очередь слишком длинная"""
+        limiter = ColorAPIClient._get_limiter(source)
+        if limiter is None:
+            return True
+        wait = limiter.reserve(Config.SOURCE_QUEUE_WAIT)
+        if wait is None:
+            metrics.RATE_LIMITED.inc(limit=source, outcome="rejected")
+            return False
+        if wait:
+            metrics.RATE_LIMITED.inc(limit=source, outcome="queued")
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Запрос отменили (победил другой источник) - место в очереди не нужно
+                limiter.refund()
+                raise
+        return True
+    
+    @staticmethod
+    def _get_latency(source: str):
+        """Статистика задержек источника (создается при первом обращении)"""
+        latency = ColorAPIClient._latencies.get(source)
+        if latency is None:
+            latency = LatencyTracker(
+                window=Config.LATENCY_WINDOW,
+                percentile=Config.ADAPTIVE_TIMEOUT_PERCENTILE,
+                multiplier=Config.ADAPTIVE_TIMEOUT_MULTIPLIER,
+                min_timeout=Config.ADAPTIVE_TIMEOUT_MIN
+            )
+            ColorAPIClient._latencies[source] = latency
+        return latency
+    
+    @staticmethod
+    def _slow_after(latency: LatencyTracker) -> float:
+        """Сколько секунд без ответа - уже медленно для проигравшего источника.
+        
+        Обычно это HEDGE_DELAY: раз следующий источник пришлось запустить и он успел
+        победить, этот запаздывал. Без задержки (все источники сразу) - перцентиль задержек
+        """
+        if Config.HEDGE_DELAY > 0:
+            return Config.HEDGE_DELAY
+        slow_after = latency.value(latency.percentile)
+        return slow_after if slow_after is not None else float('inf')
     
     @staticmethod
-    async def fetch_json(url: str, method: str = "GET", data: dict = None):
+    async def fetch_json(url: str, method: str = "GET", data: dict = None, source: str = None):
         """Получить JSON из URL"""
+        source = source or url
+        # Общий лимит источника: ждем своей очереди или сразу уходим к следующему источнику
+        if not await ColorAPIClient._wait_turn(source):
+            return None
+        breaker = ColorAPIClient._get_breaker(source)
+        if not breaker.allow():
+            # Цепь разомкнута: не ждем таймаута, сразу переходим к следующему источнику
+            limiter = ColorAPIClient._get_limiter(source)
+            if limiter is not None:
+                limiter.refund()
+            metrics.API_REJECTED.inc(source=source)
+            return None
+        
+        latency = ColorAPIClient._get_latency(source)
+        timeout = latency.timeout(Config.HTTP_TIMEOUT)
+        started = time.monotonic()
+        deadline = _source_deadline.get()
+        if deadline is not None:
+            timeout = max(min(timeout, deadline - started), 0.001)
+        result = None
+        ok = False
+        timed_out = False
         try:
-            async with aiohttp.ClientSession() as session:
-                if method == "POST":
-                    async with session.post(url, json=data, timeout=10) as response:
-                        if response.status == 200:
-                            try:
-                                return await response.json()
-                            except:
-                                # Пробуем спарсить как JSON даже если content-type не правильный
-                                text = await response.text()
-                                try:
-                                    return json.loads(text)
-                                except:
-                                    return {"error": "Invalid JSON", "text": text[:100]}
-                else:
-                    async with session.get(url, timeout=10) as response:
-                        if response.status == 200:
-                            try:
-                                return await response.json()
-                            except:
-                                text = await response.text()
-                                try:
-                                    return json.loads(text)
-                                except:
-                                    return {"error": "Invalid JSON", "text": text[:100]}
+            session = await ColorAPIClient.start_session()
+            async with session.request(
+                method, url,
+                json=data if method == "POST" else None,
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                if response.status == 200:
+                    try:
+                        result = await response.json()
+                        ok = True
+                    except Exception:
+                        # Пробуем спарсить как JSON даже если content-type не правильный
+                        text = await response.text()
+                        try:
+                            result = json.loads(text)
+                            ok = True
+                        except Exception:
+                            result = {"error": "Invalid JSON", "text": text[:100]}
+        except asyncio.TimeoutError:
+            timed_out = True
+            # Таймаут тоже учитываем в задержках, иначе таймаут не сможет вырасти обратно
+            latency.record(timeout)
+            metrics.API_TIMEOUTS.inc(source=source)
+            print(f"API Timeout {url}: {timeout:.1f}s")
+        except asyncio.CancelledError:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline - _DEADLINE_GRACE:
+                # Отменили по бюджету источника - это тот же таймаут
+                latency.record(timeout)
+                metrics.API_TIMEOUTS.inc(source=source)
+                breaker.record_failure()
+            elif now - started >= ColorAPIClient._slow_after(latency):
+                # Победил другой источник, а этот к тому времени уже запаздывал: считаем
+                # медленным ответом (время до отмены - нижняя оценка задержки), иначе
+                # зависший источник никогда не разомкнет цепь, а таймаут не подстроится
+                latency.record(now - started)
+                metrics.API_TIMEOUTS.inc(source=source)
+                breaker.record_failure()
+            else:
+                # Победил другой источник раньше, чем этот успел отстать: результата нет,
+                # пробный запрос освобождаем
+                breaker.release_probe()
+            raise
         except Exception as e:
             print(f"API Error {url}: {type(e).__name__}")
-            return None
+        
+        if ok:
+            elapsed = time.monotonic() - started
+            breaker.record_success()
+            latency.record(elapsed)
+            metrics.API_SECONDS.observe(elapsed, source=source)
+        else:
+            breaker.record_failure()
+            if not timed_out:
+                metrics.API_ERRORS.inc(source=source)
+        return result
     
     @staticmethod
     async def get_random_palette_from_colormind():
@@ -49,7 +255,8 @@ class ColorAPIClient:
             response = await ColorAPIClient.fetch_json(
                 Config.COLORMIND_API, 
                 method="POST", 
-                data=data
+                data=data,
+                source="colormind"
             )
             
             if response and 'result' in response:
@@ -67,13 +274,40 @@ class ColorAPIClient:
     @staticmethod
     async def get_color_palettes():
         """Получить цветовые палитры (работает!)"""
-        if ColorAPIClient._palettes_cache is None:
-            data = await ColorAPIClient.fetch_json(Config.COLOR_PALETTES_API)
-            if data and isinstance(data, list):
-                ColorAPIClient._palettes_cache = data
-                return data
+        if not ColorAPIClient._snapshot_checked:
+            ColorAPIClient._load_palettes_snapshot()
+        return await ColorAPIClient._palettes_cache.get()
+    
+    @staticmethod
+    def warm_up():
+        """Подхватить палитры с диска и обновить их в фоне, не задерживая старт"""
+        return asyncio.create_task(ColorAPIClient.get_color_palettes())
+    
+    @staticmethod
+    def _load_palettes_snapshot():
+        """Положить в кэш снимок палитр с диска (один раз за время работы)"""
+        ColorAPIClient._snapshot_checked = True
+        snapshot = PaletteSnapshot.load(Config.PALETTES_SNAPSHOT_PATH)
+        if snapshot is None or len(snapshot) == 0:
+            return
+        # Снимок считается устаревшим: он отдается сразу, а из сети обновляется в фоне
+        ColorAPIClient._palettes_cache.set(snapshot, updated_at=time.monotonic() - Config.PALETTES_TTL)
+    
+    @staticmethod
+    async def _load_color_palettes():
+        """Загрузить палитры из API (None при ошибке)"""
+        data = await ColorAPIClient.fetch_json(Config.COLOR_PALETTES_API, source="palettes")
+        if not data or not isinstance(data, list):
             return None
-        return ColorAPIClient._palettes_cache
+        
+        # Сохраняем снимок на диск, чтобы после перезапуска не ждать CDN
+        try:
+            await asyncio.to_thread(PaletteSnapshot.save, Config.PALETTES_SNAPSHOT_PATH, data)
+        except OSError as e:
+            print(f"Не удалось сохранить снимок палитр: {e}")
+            return data
+        snapshot = PaletteSnapshot.load(Config.PALETTES_SNAPSHOT_PATH)
+        return snapshot if snapshot else data
     
     @staticmethod
     async def get_colors_by_theme(theme: str):
@@ -81,24 +315,23 @@ class ColorAPIClient:
         if theme not in Config.THEMES:
             return None
         
-        all_colors = []
-        
-        # Метод 1: Пробуем Colormind API (работает!)
-        colors = await ColorAPIClient.get_random_palette_from_colormind()
-        if colors:
-            all_colors = colors
-        
-        # Метод 2: Если Colormind не работает, берем из палитр
-        if not all_colors:
-            palettes = await ColorAPIClient.get_color_palettes()
-            if palettes:
-                # Выбираем палитру в зависимости от темы
-                palette_index = Config.THEMES.index(theme) % len(palettes)
-                palette = palettes[palette_index]
-                if isinstance(palette, list):
-                    all_colors = [color for color in palette[:5] if isinstance(color, str) and color.startswith('#')]
+        # Метод 1: Colormind, метод 2: палитры, метод 3: локальный генератор
+        sources = [
+            ("colormind", ColorAPIClient._colors_from_colormind),
+            ("palettes", ColorAPIClient._colors_from_palettes)
+        ]
+        if Config.GENERATOR_ENABLED:
+            generator = ("generator", ColorAPIClient._colors_from_generator)
+            if Config.GENERATOR_FIRST:
+                sources.insert(0, generator)
+            else:
+                sources.append(generator)
+        if Config.HEDGED_REQUESTS:
+            all_colors = await ColorAPIClient._first_valid_hedged(sources, theme)
+        else:
+            all_colors = await ColorAPIClient._first_valid_sequential(sources, theme)
         
-        # Метод 3: Локальные цвета как последний вариант
+        # Локальные цвета как последний вариант
         if not all_colors:
             all_colors = ColorAPIClient.get_local_theme_colors(theme)
         
@@ -110,21 +343,128 @@ class ColorAPIClient:
         
         return unique_colors[:5]
     
+    @staticmethod
+    async def _colors_from_colormind(theme: str):
+        """Colormind: сначала готовая палитра из пула, потом живой запрос"""
+        colors = None
+        if ColorAPIClient._prefetcher is not None:
+            colors = ColorAPIClient._prefetcher.pop(theme)
+        if not colors:
+            colors = await ColorAPIClient.get_random_palette_from_colormind()
+        return colors
+    
+    @staticmethod
+    async def _colors_from_palettes(theme: str):
+        """Палитра из набора nice-color-palettes"""
+        palettes = await ColorAPIClient.get_color_palettes()
+        if palettes:
+            # Выбираем палитру в зависимости от темы
+            palette_index = Config.THEMES.index(theme) % len(palettes)
+            palette = palettes[palette_index]
+            if isinstance(palette, list):
+                return [color for color in palette[:5] if isinstance(color, str) and color.startswith('#')]
+        return None
+    
+    @staticmethod
+    def get_generator():
+        """Генератор палитр от локальных цветов тематик"""
+        if ColorAPIClient._generator is None:
+            ColorAPIClient._generator = PaletteGenerator(
+                ColorAPIClient.LOCAL_THEME_PALETTES, batch_size=Config.GENERATOR_BATCH
+            )
+        return ColorAPIClient._generator
+    
+    @staticmethod
+    async def _colors_from_generator(theme: str):
+        """Палитра из локального генератора (без сети)"""
+        return ColorAPIClient.get_generator().generate(theme)
+    
+    @staticmethod
+    async def _run_source(name: str, source, theme: str, budget: float):
+        """Запустить источник с его лимитом времени"""
+        budget = max(min(Config.SOURCE_TIMEOUTS.get(name, budget), budget), 0)
+        # Запросы источника получают бюджет как таймаут, а wait_for - только страховка
+        # с небольшим запасом, чтобы запрос успел завершиться своим таймаутом
+        token = _source_deadline.set(time.monotonic() + budget)
+        try:
+            return await asyncio.wait_for(source(theme), timeout=budget + _DEADLINE_GRACE)
+        except asyncio.TimeoutError:
+            print(f"Source timeout {name}: {budget:.1f}s")
+            return None
+        finally:
+            _source_deadline.reset(token)
+    
+    @staticmethod
+    async def _first_valid_sequential(sources, theme: str):
+        """Источники по очереди, пока не уложимся в общий дедлайн"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.THEME_DEADLINE
+        for name, source in sources:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            colors = await ColorAPIClient._run_source(name, source, theme, remaining)
+            if colors:
+                return colors
+        return None
+    
+    @staticmethod
+    async def _first_valid_hedged(sources, theme: str):
+        """Hedged-запрос: следующий источник стартует через HEDGE_DELAY
+        (или сразу, если предыдущие уже завершились ничем). Побеждает первый
+        непустой ответ, остальные запросы отменяются"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.THEME_DEADLINE
+        waiting = list(sources)
+        pending = set()
+        next_start = loop.time()
+        try:
+            while waiting or pending:
+                now = loop.time()
+                if now >= deadline:
+                    break
+                if waiting and (now >= next_start or not pending):
+                    name, source = waiting.pop(0)
+                    pending.add(asyncio.create_task(
+                        ColorAPIClient._run_source(name, source, theme, deadline - now)
+                    ))
+                    next_start = now + Config.HEDGE_DELAY
+                    continue
+                
+                wake_at = min(deadline, next_start) if waiting else deadline
+                done, pending = await asyncio.wait(
+                    pending, timeout=wake_at - now, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if not task.cancelled() and task.exception() is None and task.result():
+                        return task.result()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    # Локальные цвета тематик (и семена для генератора палитр)
+    LOCAL_THEME_PALETTES = {
+        "education": ["#1E3A8A", "#3B82F6", "#10B981", "#6B7280", "#FFFFFF"],
+        "bank_finance": ["#1E40AF", "#2563EB", "#059669", "#F59E0B", "#111827"],
+        "games": ["#3B82F6", "#EF4444", "#F59E0B", "#8B5CF6", "#EC4899"],
+        "health": ["#0EA5E9", "#10B981", "#FFFFFF", "#06B6D4", "#84CC16"],
+        "food": ["#DC2626", "#EA580C", "#16A34A", "#A16207", "#B91C1C"],
+        "technology": ["#1E40AF", "#1F2937", "#6B7280", "#8B5CF6", "#06B6D4"],
+        "fashion": ["#EC4899", "#000000", "#FFFFFF", "#F59E0B", "#8B5CF6"],
+        "nature": ["#15803D", "#A16207", "#0EA5E9", "#D97706", "#65A30D"]
+    }
+    
     @staticmethod
     def get_local_theme_colors(theme: str):
         """Локальные цвета для тем"""
-        theme_palettes = {
-            "education": ["#1E3A8A", "#3B82F6", "#10B981", "#6B7280", "#FFFFFF"],
-            "bank_finance": ["#1E40AF", "#2563EB", "#059669", "#F59E0B", "#111827"],
-            "games": ["#3B82F6", "#EF4444", "#F59E0B", "#8B5CF6", "#EC4899"],
-            "health": ["#0EA5E9", "#10B981", "#FFFFFF", "#06B6D4", "#84CC16"],
-            "food": ["#DC2626", "#EA580C", "#16A34A", "#A16207", "#B91C1C"],
-            "technology": ["#1E40AF", "#1F2937", "#6B7280", "#8B5CF6", "#06B6D4"],
-            "fashion": ["#EC4899", "#000000", "#FFFFFF", "#F59E0B", "#8B5CF6"],
-            "nature": ["#15803D", "#A16207", "#0EA5E9", "#D97706", "#65A30D"]
-        }
-        
-        return theme_palettes.get(theme, ["#3B82F6", "#EF4444", "#10B981", "#F59E0B", "#8B5CF6"])
+        return ColorAPIClient.LOCAL_THEME_PALETTES.get(theme, ["#3B82F6", "#EF4444", "#10B981", "#F59E0B", "#8B5CF6"])
+    
+    # Множители каналов для кнопок "ярче" / "темнее"
+    BRIGHTNESS_FACTORS = {
+        "brighter": 1.3,
+        "darker": 0.7
+    }
     
     @staticmethod
     def adjust_colors(colors: list, action: str):
@@ -132,34 +472,5 @@ class ColorAPIClient:
         if not colors:
             return colors
         
-        adjusted = []
-        
-        for hex_color in colors:
-            if not hex_color or not hex_color.startswith('#'):
-                adjusted.append(hex_color)
-                continue
-            
-            try:
-                # Конвертируем HEX в RGB
-                hex_clean = hex_color.lstrip('#')
-                r = int(hex_clean[0:2], 16)
-                g = int(hex_clean[2:4], 16)
-                b = int(hex_clean[4:6], 16)
-                
-                # Меняем яркость
-                if action == "brighter":
-                    r = min(255, int(r * 1.3))
-                    g = min(255, int(g * 1.3))
-                    b = min(255, int(b * 1.3))
-                elif action == "darker":
-                    r = max(0, int(r * 0.7))
-                    g = max(0, int(g * 0.7))
-                    b = max(0, int(b * 0.7))
-                
-                # Обратно в HEX
-                new_hex = f"#{r:02X}{g:02X}{b:02X}"
-                adjusted.append(new_hex)
-            except:
-                adjusted.append(hex_color)
-        
-        return adjusted
\ No newline at end of file
+        factor = ColorAPIClient.BRIGHTNESS_FACTORS.get(action, 1.0)
+        return color_math.transform_hex(colors, color_math.scale_rgb, factor)
\ No newline at end of file
@@ -0,0 +1,115 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import metrics
+
+# Все запросы к SQLite выполняются в одном отдельном потоке:
+# запись в файл не блокирует event loop, а сами записи идут по очереди.
+# Там же при первом обращении импортируется database (SQLAlchemy) и проверяется схема,
+# так что запуск бота их не ждет
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+
+
+def _call(method, *args):
+    import database
+    return getattr(database.Database, method)(*args)
+
+
+def _init():
+    import database
+    database.init_db()
+    metrics.mark_startup('db_ready')
+
+
+class AsyncDatabase:
+    """Асинхронные версии методов Database (выполняются в потоке БД)"""
+
+    @staticmethod
+    def start():
+        """Начать подготовку базы в потоке БД, не дожидаясь ее.
+
+        Вызывается до подключения к Telegram, чтобы импорт SQLAlchemy и миграции
+        шли параллельно с ним; первые запросы просто встанут в очередь за подготовкой
+        """
+        return _db_executor.submit(_init)
+
+    @staticmethod
+    async def _run(method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_db_executor, partial(_call, method, *args))
+
+    @staticmethod
+    async def add_user(telegram_id, username, first_name):
+        """Добавляем пользователя в БД"""
+        return await AsyncDatabase._run('add_user', telegram_id, username, first_name)
+
+    @staticmethod
+    async def add_favorite_color(telegram_id, color_hex):
+        """Добавляем цвет в избранное"""
+        return await AsyncDatabase._run('add_favorite_color', telegram_id, color_hex)
+
+    @staticmethod
+    async def add_favorite_colors(telegram_id, colors):
+        """Добавляем несколько цветов в избранное одной транзакцией"""
+        return await AsyncDatabase._run('add_favorite_colors', telegram_id, colors)
+
+    @staticmethod
+    async def get_user_favorite_colors(telegram_id):
+        """Получить избранные цвета пользователя"""
+        return await AsyncDatabase._run('get_user_favorite_colors', telegram_id)
+
+    @staticmethod
+    async def get_user_favorite_colors_page(telegram_id, before=None, after=None, limit=20):
+        """Страница избранных цветов"""
+        return await AsyncDatabase._run('get_user_favorite_colors_page', telegram_id, before, after, limit)
+
+    @staticmethod
+    async def count_user_favorite_colors(telegram_id):
+        """Число избранных цветов"""
+        return await AsyncDatabase._run('count_user_favorite_colors', telegram_id)
+
+    @staticmethod
+    async def add_favorite_palettes(telegram_id, palettes):
+        """Добавить палитры в избранное одной транзакцией"""
+        return await AsyncDatabase._run('add_favorite_palettes', telegram_id, palettes)
+
+    @staticmethod
+    async def get_user_favorite_palettes_chunk(telegram_id, after=None, limit=500):
+        """Пачка палитр для экспорта"""
+        return await AsyncDatabase._run('get_user_favorite_palettes_chunk', telegram_id, after, limit)
+
+    @staticmethod
+    async def clear_user_favorites(telegram_id):
+        """Очистить все избранное пользователя"""
+        return await AsyncDatabase._run('clear_user_favorites', telegram_id)
+
+    @staticmethod
+    async def get_user_stats(telegram_id):
+        """Получить статистику пользователя"""
+        return await AsyncDatabase._run('get_user_stats', telegram_id)
+
+    @staticmethod
+    async def get_user_id(telegram_id):
+        """Внутренний id пользователя по его telegram_id"""
+        return await AsyncDatabase._run('get_user_id', telegram_id)
+
+    @staticmethod
+    async def load_session(telegram_id, now):
+        """Упакованное состояние пользователя"""
+        return await AsyncDatabase._run('load_session', telegram_id, now)
+
+    @staticmethod
+    async def save_sessions(rows):
+        """Записать пачку состояний одной транзакцией"""
+        return await AsyncDatabase._run('save_sessions', rows)
+
+    @staticmethod
+    async def purge_sessions(now):
+        """Удалить истекшие состояния"""
+        return await AsyncDatabase._run('purge_sessions', now)
+
+    @staticmethod
+    def shutdown():
+        """Дождаться завершения запросов и остановить поток БД"""
+        _db_executor.submit(_call, 'optimize')
+        _db_executor.shutdown(wait=True)
@@ -0,0 +1,74 @@
+"""Сравнение прежнего цикла adjust_colors с векторным color_math.
+
+Запуск из корня проекта:
+    python benchmarks/bench_color_math.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import color_math
+
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+
+
+def legacy_adjust_colors(colors: list, action: str):
+    """Прежняя реализация ColorAPIClient.adjust_colors (поцветный цикл)"""
+    adjusted = []
+    for hex_color in colors:
+        if not hex_color or not hex_color.startswith('#'):
+            adjusted.append(hex_color)
+            continue
+        try:
+            hex_clean = hex_color.lstrip('#')
+            r = int(hex_clean[0:2], 16)
+            g = int(hex_clean[2:4], 16)
+            b = int(hex_clean[4:6], 16)
+            if action == "brighter":
+                r = min(255, int(r * 1.3))
+                g = min(255, int(g * 1.3))
+                b = min(255, int(b * 1.3))
+            elif action == "darker":
+                r = max(0, int(r * 0.7))
+                g = max(0, int(g * 0.7))
+                b = max(0, int(b * 0.7))
+            adjusted.append(f"#{r:02X}{g:02X}{b:02X}")
+        except:
+            adjusted.append(hex_color)
+    return adjusted
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'colors':>10} {'legacy, ms':>12} {'numpy, ms':>12} {'speedup':>9} {'oklab, ms':>11}")
+    for size in SIZES:
+        colors = [f"#{rng.randrange(1 << 24):06X}" for _ in range(size)]
+        repeat = 5 if size <= 10 ** 5 else 2
+
+        legacy_time, legacy = best_of(lambda: legacy_adjust_colors(colors, "brighter"), repeat)
+        numpy_time, vectorized = best_of(
+            lambda: color_math.transform_hex(colors, color_math.scale_rgb, 1.3), repeat
+        )
+        assert legacy == vectorized, "результаты не совпадают"
+        oklab_time, _ = best_of(
+            lambda: color_math.transform_hex(colors, color_math.shift_oklch, lightness=0.1), repeat
+        )
+
+        print(f"{size:>10} {legacy_time * 1000:>12.1f} {numpy_time * 1000:>12.1f} "
+              f"{legacy_time / numpy_time:>8.1f}x {oklab_time * 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Скорость локального генератора палитр: палитр в секунду.
+
+Меряет три вещи: вычисление пачки палитр (generate_batch) для нескольких размеров пачки,
+выдачу по одной палитре из пула с пополнением (generate - то, что получает обработчик) и
+полный путь ColorAPIClient.get_colors_by_theme с генератором первым источником.
+
+Запуск из корня проекта:
+    python benchmarks/bench_generator.py --seconds 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ROOT, git_commit
+
+sys.path.insert(0, ROOT)
+
+from api_client import ColorAPIClient
+from config import Config
+from palette_generator import PaletteGenerator
+
+
+def rate(func, seconds: float, per_call: int = 1):
+    """Палитр в секунду: func вызывается, пока не пройдет seconds"""
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        func()
+        calls += 1
+    elapsed = time.perf_counter() - started
+    return calls * per_call / elapsed
+
+
+async def theme_rate(seconds: float):
+    Config.GENERATOR_FIRST = True
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        await ColorAPIClient.get_colors_by_theme(Config.THEMES[calls % len(Config.THEMES)])
+        calls += 1
+    return calls / (time.perf_counter() - started)
+
+
+def run(args):
+    themes = Config.THEMES
+    batches = {}
+    for size in args.batch_sizes:
+        generator = PaletteGenerator(ColorAPIClient.LOCAL_THEME_PALETTES, batch_size=size, seed=args.seed)
+        batches[size] = round(rate(lambda: generator.generate_batch(themes[0], size), args.seconds, size))
+
+    generator = PaletteGenerator(ColorAPIClient.LOCAL_THEME_PALETTES, batch_size=Config.GENERATOR_BATCH,
+                                 seed=args.seed)
+    served = [0]
+
+    def serve():
+        generator.generate(themes[served[0] % len(themes)])
+        served[0] += 1
+
+    per_palette = rate(serve, args.seconds)
+    sample = {theme: generator.generate(theme) for theme in themes}
+    return {
+        "commit": git_commit(),
+        "batch_size": Config.GENERATOR_BATCH,
+        "palettes_per_s": {
+            "generate": round(per_palette),
+            "generate_batch": batches,
+            "get_colors_by_theme": round(asyncio.run(theme_rate(args.seconds))),
+        },
+        "us_per_palette": round(1e6 / per_palette, 2),
+        "sample": sample,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость локального генератора палитр")
+    parser.add_argument('--seconds', type=float, default=2, help="время на каждый замер")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16, 256, 4096])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    print(json.dumps(run(args), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Холодный старт бота: время до первого обработанного обновления.
+
+Запускает `python bot.py` отдельным процессом против поддельного Bot API и заглушек API
+цветов из load_test.py (база - временная), сразу ставит в очередь /start и меряет время
+от запуска процесса до ответа бота. Дополнительно - разбивка импорта bot по модулям
+(python -X importtime) и сравнение с целью Config.STARTUP_TARGET.
+
+Запуск из корня проекта:
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ROOT, FakeBotAPI, StubColorServices, git_commit, start_server
+
+sys.path.insert(0, ROOT)
+
+from config import Config
+
+CHAT_ID = 1000
+
+
+def import_breakdown(env):
+    """Модули, которые импортирует bot, и их суммарное время импорта (мс)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import bot'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|', 2)
+        if not cumulative.strip().isdigit():
+            continue
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        module = name.strip()
+        if level == 0:
+            if module == 'bot':
+                total = int(cumulative) / 1000
+                modules = sorted(children, key=lambda item: -item[1])
+                return total, {module: round(ms, 1) for module, ms in modules}
+            children = []
+        elif level == 1:
+            children.append((module, int(cumulative) / 1000))
+    return None, {}
+
+
+async def first_update(env, timeout: float):
+    """Секунды от запуска процесса бота до его первого ответа"""
+    api = FakeBotAPI(latency=0)
+    api_runner, api_url = await start_server(api.app())
+    env = dict(env, TELEGRAM_API_URL=f'{api_url}/bot', TELEGRAM_FILE_URL=f'{api_url}/file/bot')
+
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, 'bot.py', cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+    api.send_text(CHAT_ID, '/start')
+    try:
+        await asyncio.wait_for(api.replies[CHAT_ID].get(), timeout)
+        return time.perf_counter() - started
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        process.terminate()
+        await process.wait()
+        await api_runner.cleanup()
+
+
+async def run(args):
+    stubs = StubColorServices(latency=0, jitter=0, error_rate=0, seed=args.seed)
+    stubs_runner, stubs_url = await start_server(stubs.app())
+    with tempfile.TemporaryDirectory(prefix='colorbot-startup-') as data_dir:
+        env = dict(os.environ, BOT_TOKEN='1:BENCH', DB_PATH=os.path.join(data_dir, 'colors.db'),
+                   COLORMIND_API=f'{stubs_url}/colormind',
+                   COLOR_PALETTES_API=f'{stubs_url}/palettes.json')
+        # Первый запуск создает базу, остальные - как обычный перезапуск с готовой базой
+        first_run = await first_update(env, args.timeout)
+        timings = [await first_update(env, args.timeout) for _ in range(args.runs)]
+        import_total, imports = import_breakdown(env)
+    await stubs_runner.cleanup()
+
+    measured = [seconds for seconds in timings if seconds is not None]
+    median = statistics.median(measured) if measured else None
+    return {
+        "commit": git_commit(),
+        "runs": args.runs,
+        "failed": len(timings) - len(measured),
+        "first_run_s": round(first_run, 3) if first_run is not None else None,
+        "time_to_first_update_s": {
+            "median": round(median, 3) if median is not None else None,
+            "min": round(min(measured), 3) if measured else None,
+            "max": round(max(measured), 3) if measured else None,
+        },
+        "target_s": Config.STARTUP_TARGET,
+        "within_target": median is not None and median <= Config.STARTUP_TARGET,
+        "import_bot_ms": import_total,
+        "imports_ms": imports,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время холодного старта бота")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
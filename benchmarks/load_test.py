@@ -0,0 +1,383 @@
+"""Нагрузочный тест бота на локальных заглушках.
+
+В одном процессе поднимаются:
+- поддельный Bot API: getUpdates отдает синтетические обновления, sendMessage и sendPhoto
+  записывают ответы бота;
+- заглушки Colormind и списка палитр с настраиваемой задержкой и долей ошибок;
+- сам бот (bot.build_application) с временной базой: в режиме polling (по умолчанию)
+  или webhook (--mode webhook) - тогда поддельный Bot API сам отправляет обновления
+  на встроенный webhook-сервер бота с секретным заголовком, как это делает Telegram.
+  В режиме webhook дополнительно проверяется, что запрос без секрета отклоняется.
+
+N пользователей одновременно проходят сценарий
+/start -> тема -> ярче -> добавить все -> мои цвета. Итог - JSON с пропускной способностью,
+перцентилями задержки по шагам и по обработчикам и коммитом, на котором шел тест,
+чтобы результаты разных коммитов можно было сравнивать.
+
+Запуск из корня проекта:
+    python benchmarks/load_test.py --users 50 --flows 3 --output bench.json
+    python benchmarks/load_test.py --mode webhook --users 50
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STEP_TIMEOUT = 30
+WEBHOOK_SECRET = 'load-test-secret'
+WEBHOOK_PATH = '/telegram'
+# Заголовок, в котором Telegram присылает секрет webhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def is_palette_reply(text: str):
+    """Ответ, которым заканчивается показ палитры: сама палитра или ошибка.
+    Промежуточные «🔄 Получаю цвета...» и «⏳ Слишком часто!» (лимит выбора тематики,
+    палитра придет позже) шаг не завершают"""
+    return text.startswith(("🎨", "❌"))
+
+
+def user_flow(rng):
+    """Шаги сценария: (имя шага, текст сообщения, каким ответом шаг заканчивается;
+    None - первым же ответом)"""
+    # Подписи кнопок - из самого бота (он уже импортирован с настройками теста)
+    import handlers
+    from config import Config
+    return [
+        ("start", "/start", None),
+        ("select_theme", rng.choice(list(Config.THEME_DESCRIPTIONS.values())), is_palette_reply),
+        ("adjust_colors", handlers.BTN_BRIGHTER, is_palette_reply),
+        ("save_all_colors", handlers.BTN_SAVE_ALL, None),
+        ("show_my_colors", handlers.BTN_MY_COLORS, None),
+    ]
+
+
+async def start_server(app: web.Application):
+    """Запустить aiohttp-приложение на свободном порту, вернуть (runner, адрес)"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f'http://127.0.0.1:{port}'
+
+
+class FakeBotAPI:
+    """Поддельный Bot API: ответы бота по чатам и доставка обновлений -
+    через очередь getUpdates или POST на webhook (если задан webhook_url)"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = Counter()
+        self.replies = defaultdict(asyncio.Queue)
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.webhook_statuses = Counter()
+        self._pending = []
+        self._has_updates = asyncio.Event()
+        self._update_id = 0
+        self._message_id = 0
+        self._deliveries = set()
+        self._client = None
+
+    def app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+    def update(self, chat_id: int, text: str):
+        """Обновление с сообщением пользователя в формате Bot API"""
+        self._update_id += 1
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"},
+            "text": text,
+        }
+        if text.startswith('/'):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self._update_id, "message": message}
+
+    def send_text(self, chat_id: int, text: str):
+        """Сообщение пользователя - в очередь getUpdates или сразу на webhook бота"""
+        update = self.update(chat_id, text)
+        if self.webhook_url is None:
+            self._pending.append(update)
+            self._has_updates.set()
+            return
+        task = asyncio.create_task(self.deliver(update, self.webhook_secret))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def deliver(self, update: dict, secret: str = None):
+        """POST обновления на webhook, как это делает Telegram; возвращает HTTP-статус"""
+        if self._client is None:
+            self._client = aiohttp.ClientSession()
+        headers = {SECRET_HEADER: secret} if secret is not None else {}
+        async with self._client.post(self.webhook_url, json=update, headers=headers) as response:
+            self.webhook_statuses[response.status] += 1
+            return response.status
+
+    async def close(self):
+        if self._deliveries:
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self._client is not None:
+            await self._client.close()
+
+    async def handle(self, request: web.Request):
+        method = request.match_info['method']
+        self.calls[method] += 1
+        data = await request.post()
+
+        if method == 'getUpdates':
+            if not self._pending:
+                self._has_updates.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._has_updates.wait(), float(data.get('timeout') or 0))
+            updates, self._pending = self._pending[:100], self._pending[100:]
+            return web.json_response({"ok": True, "result": updates})
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == 'getMe':
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}})
+        if method in ('sendMessage', 'sendPhoto'):
+            chat_id = int(data['chat_id'])
+            self._message_id += 1
+            result = {"message_id": self._message_id, "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "private"}}
+            if method == 'sendPhoto':
+                result["photo"] = [{"file_id": f"photo-{self._message_id}",
+                                    "file_unique_id": f"u{self._message_id}", "width": 800, "height": 200}]
+                result["caption"] = data.get('caption', '')
+            else:
+                result["text"] = data.get('text', '')
+            self.replies[chat_id].put_nowait(result.get("text", result.get("caption")))
+            return web.json_response({"ok": True, "result": result})
+        return web.json_response({"ok": True, "result": True})
+
+
+class StubColorServices:
+    """Заглушки Colormind и списка палитр с задержкой и долей ошибок"""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = Counter()
+        self.errors = Counter()
+        self.palettes = [[f"#{self.rng.randrange(1 << 24):06x}" for _ in range(5)] for _ in range(100)]
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/colormind', self.colormind)
+        app.router.add_get('/palettes.json', self.palettes_list)
+        return app
+
+    async def _delay(self, name: str):
+        """Задержка ответа; True - ответить ошибкой"""
+        self.requests[name] += 1
+        await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+        if self.rng.random() < self.error_rate:
+            self.errors[name] += 1
+            return True
+        return False
+
+    async def colormind(self, request: web.Request):
+        if await self._delay('colormind'):
+            return web.Response(status=500)
+        return web.json_response({"result": [[self.rng.randrange(256) for _ in range(3)] for _ in range(5)]})
+
+    async def palettes_list(self, request: web.Request):
+        if await self._delay('palettes'):
+            return web.Response(status=500)
+        return web.json_response(self.palettes)
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(rank(50), 2),
+        "p90_ms": round(rank(90), 2),
+        "p99_ms": round(rank(99), 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_user(api: FakeBotAPI, chat_id: int, flows: int, seed: int, think_time: float,
+                   timings, errors: Counter):
+    rng = random.Random(seed + chat_id)
+    for _ in range(flows):
+        for step, text, is_last in user_flow(rng):
+            started = time.perf_counter()
+            api.send_text(chat_id, text)
+            try:
+                while True:
+                    reply = await asyncio.wait_for(api.replies[chat_id].get(), STEP_TIMEOUT)
+                    if is_last is None or is_last(reply):
+                        break
+            except asyncio.TimeoutError:
+                errors[step] += 1
+                continue
+            timings[step].append(time.perf_counter() - started)
+            if think_time:
+                await asyncio.sleep(rng.uniform(0, think_time))
+
+
+async def run(args):
+    api = FakeBotAPI(args.telegram_latency / 1000)
+    stubs = StubColorServices(args.api_latency / 1000, args.api_jitter / 1000, args.api_error_rate, args.seed)
+    api_runner, api_url = await start_server(api.app())
+    stubs_runner, stubs_url = await start_server(stubs.app())
+
+    data_dir = tempfile.TemporaryDirectory(prefix='colorbot-bench-')
+    os.environ.update({
+        'BOT_TOKEN': '1:BENCH',
+        'TELEGRAM_API_URL': f'{api_url}/bot',
+        'TELEGRAM_FILE_URL': f'{api_url}/file/bot',
+        'COLORMIND_API': f'{stubs_url}/colormind',
+        'COLOR_PALETTES_API': f'{stubs_url}/palettes.json',
+        'DB_PATH': os.path.join(data_dir.name, 'colors.db'),
+    })
+    if args.mode == 'webhook':
+        os.environ.update({'BOT_MODE': 'webhook', 'WEBHOOK_SECRET': WEBHOOK_SECRET})
+    # Бот импортируется после настройки окружения: Config читается при импорте
+    import bot
+    import metrics
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    logging.getLogger('aiohttp.access').setLevel(logging.WARNING)
+
+    app = bot.build_application()
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    server = None
+    forged_status = None
+    if args.mode == 'webhook':
+        from webhook import WebhookServer
+        server = WebhookServer(app, WEBHOOK_PATH, WEBHOOK_SECRET, '127.0.0.1', 0)
+        await server.start()
+        api.webhook_url = f'http://127.0.0.1:{server.port}{WEBHOOK_PATH}'
+        api.webhook_secret = WEBHOOK_SECRET
+    else:
+        await app.updater.start_polling(poll_interval=0, timeout=10)
+    await app.start()
+    if server is not None:
+        # Поддельное обновление без секрета должно быть отклонено, а не обработано
+        forged_status = await api.deliver(api.update(1, "✅ Да, очистить всё"))
+
+    timings = defaultdict(list)
+    errors = Counter()
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            run_user(api, 1000 + user, args.flows, args.seed, args.think_time, timings, errors)
+            for user in range(args.users)
+        ))
+    finally:
+        duration = time.perf_counter() - started
+        await api.close()
+        if server is not None:
+            await server.stop()
+        else:
+            await app.updater.stop()
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        await api_runner.cleanup()
+        await stubs_runner.cleanup()
+        data_dir.cleanup()
+
+    steps = sum(len(values) for values in timings.values())
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "params": vars(args),
+        "duration_s": round(duration, 3),
+        "steps": steps,
+        "errors": dict(errors),
+        "throughput": {
+            "steps_per_s": round(steps / duration, 2),
+            "flows_per_s": round(len(timings.get("show_my_colors", [])) / duration, 2),
+        },
+        "latency_by_step": {step: percentiles(values) for step, values in timings.items()},
+        "handlers": {
+            handler: {"count": count, "mean_ms": round(average * 1000, 2), "p95_le_ms": p95 * 1000}
+            for handler, (count, average, p95) in metrics.HANDLER_SECONDS.summary('handler').items()
+        },
+        "stubs": {name: {"requests": stubs.requests[name], "errors": stubs.errors[name]}
+                  for name in stubs.requests},
+        "bot_api_calls": dict(api.calls),
+        "webhook": {"forged_update_status": forged_status,
+                    "statuses": dict(api.webhook_statuses)} if server is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальных заглушках")
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default='polling',
+                        help="как бот получает обновления")
+    parser.add_argument('--users', type=int, default=50, help="одновременных пользователей")
+    parser.add_argument('--flows', type=int, default=3, help="сценариев на пользователя")
+    parser.add_argument('--think-time', type=float, default=0.0, help="пауза между шагами, до N секунд")
+    parser.add_argument('--api-latency', type=float, default=50, help="задержка заглушек API, мс")
+    parser.add_argument('--api-jitter', type=float, default=20, help="разброс задержки, мс")
+    parser.add_argument('--api-error-rate', type=float, default=0.05, help="доля ответов 500")
+    parser.add_argument('--telegram-latency', type=float, default=5, help="задержка Bot API, мс")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="записать JSON в файл")
+    args = parser.parse_args()
+
+    # Вывод бота (print, логи) - в stderr, чтобы в stdout остался только JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
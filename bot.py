@@ -1,7 +1,19 @@
+import time
+# Точка отсчета для замера запуска - до тяжелых импортов
+_process_started = time.perf_counter()
+
+import asyncio
 import logging
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 from config import Config
+import metrics
 from handlers import Handlers
+from api_client import ColorAPIClient
+from async_database import AsyncDatabase
+from update_processor import ChatShardedUpdateProcessor
+
+metrics.startup_begin(_process_started)
+metrics.mark_startup('imports')
 
 # Настройка логирования
 logging.basicConfig(
@@ -10,24 +22,98 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def on_startup(app: Application):
+    """Действия при старте приложения"""
+    # Сюда приходим после app.initialize(): подключение к Telegram (getMe) готово
+    metrics.mark_startup('telegram')
+    # Одна HTTP-сессия на всё время работы бота
+    await ColorAPIClient.start_session()
+    ColorAPIClient.warm_up()
+    ColorAPIClient.start_prefetch()
+    await Handlers.sessions.start()
+    # В режиме webhook /metrics отдает сам webhook-сервер
+    if Config.METRICS_PORT and Config.BOT_MODE != "webhook":
+        from webhook import start_metrics_server
+        app.bot_data["metrics_runner"] = await start_metrics_server(Config.WEBHOOK_LISTEN, Config.METRICS_PORT)
+    
+    metrics.mark_startup('post_init')
+    phases = metrics.startup_phases()
+    breakdown = ", ".join(f"{phase} {seconds:.2f} с" for phase, seconds in phases.items())
+    if phases['post_init'] > Config.STARTUP_TARGET:
+        logger.warning("Запуск дольше цели %.1f с: %s", Config.STARTUP_TARGET, breakdown)
+    else:
+        logger.info("Запуск: %s", breakdown)
+
+async def on_stop(app: Application):
+    """Прием обновлений остановлен, а обработчик очереди чатов еще работает"""
+    # Сначала дорабатываем принятые обновления (они еще могут отложить выбор тематики),
+    # затем отменяем отложенные: позже они попали бы в остановленную очередь чатов
+    # или в закрытую HTTP-сессию
+    if isinstance(app.update_processor, ChatShardedUpdateProcessor):
+        await app.update_processor.join()
+    await Handlers.theme_requests.close()
+
+async def on_shutdown(app: Application):
+    """Действия при остановке приложения"""
+    runner = app.bot_data.pop("metrics_runner", None)
+    if runner is not None:
+        await runner.cleanup()
+    await ColorAPIClient.stop_prefetch()
+    await ColorAPIClient.close_session()
+    await Handlers.sessions.close()
+    AsyncDatabase.shutdown()
+
+def build_application():
+    """Создать приложение и зарегистрировать обработчики (общие для polling и webhook)"""
+    builder = (
+        Application.builder()
+        .token(Config.BOT_TOKEN)
+        .base_url(Config.TELEGRAM_API_URL)
+        .base_file_url(Config.TELEGRAM_FILE_URL)
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if Config.BOT_MODE == "webhook":
+        # Обновления приходят во встроенный HTTP-сервер, getUpdates не нужен
+        builder = builder.updater(None)
+    if Config.CONCURRENT_UPDATES:
+        # Разные чаты обрабатываются параллельно, каждый чат - по порядку
+        builder = builder.concurrent_updates(ChatShardedUpdateProcessor(
+            workers=Config.UPDATE_WORKERS,
+            queue_limit=Config.UPDATE_QUEUE_LIMIT
+        ))
+    app = builder.build()
+    metrics.register_gauge('colorbot_update_queue_size', 'Обновления, ждущие обработки', app.update_queue.qsize)
+    
+    # Регистрируем команды (из таблицы маршрутов обработчиков)
+    for command, callback in Handlers.router.commands.items():
+        app.add_handler(CommandHandler(command, callback))
+    
+    # Регистрируем обработчик текстовых сообщений (кнопки и HEX-коды)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, Handlers.handle_text))
+    # Файлы с палитрами для импорта
+    app.add_handler(MessageHandler(filters.Document.ALL, Handlers.import_palettes))
+    
+    metrics.mark_startup('build')
+    # База готовится в своем потоке, пока приложение подключается к Telegram
+    AsyncDatabase.start()
+    return app
+
 def main():
     """Запуск бота"""
     if not Config.BOT_TOKEN:
         print("❌ Ошибка: не найден токен бота")
         print("Создайте файл .env и добавьте BOT_TOKEN=ваш_токен")
         return
+    if Config.BOT_MODE == "webhook" and not Config.WEBHOOK_SECRET:
+        print("❌ Ошибка: для режима webhook нужен WEBHOOK_SECRET")
+        print("Без него любой, кто узнал адрес, может слать боту обновления от имени пользователей")
+        return
     
     try:
         # Создаем приложение
-        app = Application.builder().token(Config.BOT_TOKEN).build()
-        
-        # Регистрируем команды
-        app.add_handler(CommandHandler("start", Handlers.start))
-        app.add_handler(CommandHandler("help", Handlers.show_help))
-        app.add_handler(CommandHandler("favorites", Handlers.show_favorites_menu))
-        
-        # Регистрируем обработчик текстовых сообщений
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, Handlers.handle_text))
+        app = build_application()
         
         # Запускаем бота
         print("✅ Бот запущен")
@@ -36,7 +122,12 @@ def main():
             print(f"  • {theme}: {desc}")
         print("\n🤖 Бот готов к работе...")
         
-        app.run_polling()
+        if Config.BOT_MODE == "webhook":
+            print(f"🌐 Режим webhook: {Config.WEBHOOK_LISTEN}:{Config.WEBHOOK_PORT}{Config.WEBHOOK_PATH}")
+            from webhook import run_webhook
+            asyncio.run(run_webhook(app))
+        else:
+            app.run_polling()
         
     except Exception as e:
         print(f"❌ Ошибка при запуске: {e}")
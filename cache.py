@@ -0,0 +1,132 @@
+from collections import OrderedDict
+import asyncio
+import time
+
+class LRUCache:
+    """Кэш ограниченного размера: при переполнении вытесняется самая старая запись"""
+
+    def __init__(self, maxsize: int, track_stats: bool = True):
+        self.maxsize = maxsize
+        self.track_stats = track_stats
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Получить значение и отметить запись как недавно использованную"""
+        try:
+            value = self._data[key]
+        except KeyError:
+            if self.track_stats:
+                self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        if self.track_stats:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Сохранить значение, при необходимости вытеснив самую старую запись"""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Удалить запись из кэша"""
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        """Размер кэша и счетчики попаданий"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+class RefreshingCache:
+    """Асинхронный кэш одного значения с временем жизни.
+
+    Свежее значение отдается сразу. Устаревшее тоже отдается сразу, а обновление
+    запускается в фоне. Одновременные промахи ждут одну общую загрузку.
+    После неудачной загрузки следующая попытка откладывается с растущей паузой
+    """
+
+    def __init__(self, loader, ttl: float, stale_ttl: float,
+                 retry_backoff: float, retry_backoff_max: float):
+        # loader - корутина без аргументов, None означает неудачу
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.value = None
+        self.updated_at = 0.0
+        self.failures = 0
+        self.retry_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._task = None
+
+    def set(self, value, updated_at: float = None):
+        """Положить значение в кэш вручную"""
+        self.value = value
+        self.updated_at = time.monotonic() if updated_at is None else updated_at
+
+    async def get(self):
+        """Получить значение (None, если загрузить так и не удалось)"""
+        age = time.monotonic() - self.updated_at
+        if self.value is not None and age < self.ttl + self.stale_ttl:
+            self.hits += 1
+            if age >= self.ttl:
+                # Отдаем устаревшее значение, обновляем в фоне
+                self.refresh()
+            return self.value
+
+        self.misses += 1
+        task = self.refresh()
+        if task is not None:
+            # shield: отмена одного запроса не отменяет общую загрузку
+            await asyncio.shield(task)
+        return self.value
+
+    def refresh(self):
+        """Запустить загрузку, если она еще не идет и не действует пауза после ошибки"""
+        if self._task is not None:
+            return self._task
+        if time.monotonic() < self.retry_at:
+            return None
+        self._task = asyncio.create_task(self._load())
+        return self._task
+
+    async def _load(self):
+        try:
+            try:
+                value = await self.loader()
+            except Exception as e:
+                print(f"Cache loader error: {type(e).__name__}")
+                value = None
+
+            if value is not None:
+                self.set(value)
+                self.failures = 0
+                self.retry_at = 0.0
+            else:
+                self.failures += 1
+                delay = min(self.retry_backoff * 2 ** (self.failures - 1), self.retry_backoff_max)
+                self.retry_at = time.monotonic() + delay
+        finally:
+            self._task = None
@@ -0,0 +1,201 @@
+import numpy as np
+import color_math
+import metrics
+from api_client import ColorAPIClient
+from cache import LRUCache
+from config import Config
+
+
+class ColorIndex:
+    """Поиск ближайших цветов в OKLab по равномерной 3D-сетке.
+
+    Цвета добавляются инкрементально. Запрос просматривает ячейки слоями вокруг
+    цвета запроса и останавливается, как только следующий слой уже не может
+    содержать цвет ближе найденных. Для маленьких или разреженных наборов
+    дешевле просто посчитать расстояния до всех цветов
+    """
+
+    # До стольких цветов поиск идет полным перебором
+    BRUTE_FORCE_LIMIT = 2048
+
+    def __init__(self, cell_size: float = 0.015):
+        self.cell_size = cell_size
+        self._points = np.empty((64, 3))
+        self._colors = []
+        self._known = set()
+        self._cells = {}
+        self._cell_arrays = {}
+        self._min_cell = None
+        self._max_cell = None
+
+    def __len__(self):
+        return len(self._colors)
+
+    def add(self, colors):
+        """Добавить HEX-цвета (повторы и некорректные значения пропускаются)"""
+        new_colors = []
+        for color in colors:
+            if isinstance(color, str):
+                color = color.upper()
+                if color not in self._known:
+                    self._known.add(color)
+                    new_colors.append(color)
+        if not new_colors:
+            return 0
+
+        rgb, valid = color_math.hex_to_rgb(new_colors)
+        if not valid.all():
+            new_colors = [color for color, ok in zip(new_colors, valid.tolist()) if ok]
+            rgb = rgb[valid]
+        if not new_colors:
+            return 0
+        lab = color_math.rgb_to_oklab(rgb)
+
+        start = len(self._colors)
+        end = start + len(new_colors)
+        if end > len(self._points):
+            # Растим буфер в 2 раза, чтобы добавление было амортизированно O(1)
+            grown = np.empty((max(end, len(self._points) * 2), 3))
+            grown[:start] = self._points[:start]
+            self._points = grown
+        self._points[start:end] = lab
+        self._colors.extend(new_colors)
+
+        keys = np.floor(lab / self.cell_size).astype(np.int64)
+        for index, key in enumerate(map(tuple, keys.tolist()), start):
+            self._cells.setdefault(key, []).append(index)
+            self._cell_arrays.pop(key, None)
+
+        low, high = keys.min(axis=0), keys.max(axis=0)
+        if self._min_cell is None:
+            self._min_cell, self._max_cell = low, high
+        else:
+            self._min_cell = np.minimum(self._min_cell, low)
+            self._max_cell = np.maximum(self._max_cell, high)
+        return len(new_colors)
+
+    def query(self, color: str, k: int = 5):
+        """k ближайших цветов: список пар (HEX, расстояние в OKLab)"""
+        if not self._colors:
+            return []
+        rgb, valid = color_math.hex_to_rgb([color])
+        if not valid[0]:
+            return []
+        target = color_math.rgb_to_oklab(rgb)[0]
+        if len(self._colors) <= ColorIndex.BRUTE_FORCE_LIMIT:
+            return self._query_all(target, k)
+        center = np.floor(target / self.cell_size).astype(np.int64)
+
+        # Дальше этого слоя ячеек с цветами точно нет
+        max_radius = int(max(np.abs(center - self._min_cell).max(), np.abs(center - self._max_cell).max()))
+
+        found_indices = []
+        found_distances = []
+        for radius in range(max_radius + 1):
+            if 24 * radius * radius + 2 > len(self._cells):
+                # Слой уже больше, чем занятых ячеек: дешевле проверить все цвета
+                return self._query_all(target, k)
+            shell = [array for array in map(self._cell_array, self._shell(center, radius)) if array is not None]
+            if shell:
+                indices = np.concatenate(shell) if len(shell) > 1 else shell[0]
+                found_indices.append(indices)
+                found_distances.append(np.linalg.norm(self._points[indices] - target, axis=1))
+
+            if found_distances and radius < max_radius:
+                distances = np.concatenate(found_distances)
+                # Все непросмотренные цвета не ближе radius ячеек
+                if len(distances) >= k and np.partition(distances, k - 1)[k - 1] <= radius * self.cell_size:
+                    break
+
+        if not found_distances:
+            return []
+        indices = np.concatenate(found_indices)
+        distances = np.concatenate(found_distances)
+        order = np.argsort(distances)[:k]
+        return [(self._colors[indices[i]], float(distances[i])) for i in order]
+
+    def _query_all(self, target, k: int):
+        distances = np.linalg.norm(self._points[:len(self._colors)] - target, axis=1)
+        if len(distances) > k:
+            order = np.argpartition(distances, k - 1)[:k]
+            order = order[np.argsort(distances[order])]
+        else:
+            order = np.argsort(distances)
+        return [(self._colors[i], float(distances[i])) for i in order]
+
+    def _cell_array(self, key):
+        array = self._cell_arrays.get(key)
+        if array is None:
+            members = self._cells.get(key)
+            if members is None:
+                return None
+            array = np.array(members, dtype=np.int64)
+            self._cell_arrays[key] = array
+        return array
+
+    @staticmethod
+    def _shell(center, radius: int):
+        """Ключи ячеек на расстоянии ровно radius (по Чебышеву) от центра"""
+        cx, cy, cz = (int(value) for value in center)
+        if radius == 0:
+            yield (cx, cy, cz)
+            return
+        span = range(-radius, radius + 1)
+        for dx in span:
+            edge_x = abs(dx) == radius
+            for dy in span:
+                if edge_x or abs(dy) == radius:
+                    for dz in span:
+                        yield (cx + dx, cy + dy, cz + dz)
+                else:
+                    yield (cx + dx, cy + dy, cz - radius)
+                    yield (cx + dx, cy + dy, cz + radius)
+
+
+class SimilarColors:
+    """Индексы для поиска похожих цветов: общий по палитрам и по избранному пользователей"""
+
+    palette_index = ColorIndex(Config.SIMILAR_INDEX_CELL)
+    _indexed_palettes = None
+    _local_indexed = False
+
+    # telegram_id -> ColorIndex избранного
+    user_indexes = LRUCache(Config.SIMILAR_USER_INDEXES)
+    metrics.register_cache("similar_user_indexes", user_indexes)
+
+    @staticmethod
+    def update_palettes(palettes):
+        """Добавить в общий индекс цвета набора палитр (один раз на каждый набор)"""
+        if not SimilarColors._local_indexed:
+            for theme in Config.THEMES:
+                SimilarColors.palette_index.add(ColorAPIClient.get_local_theme_colors(theme))
+            SimilarColors._local_indexed = True
+        if palettes is None or palettes is SimilarColors._indexed_palettes:
+            return
+        # Некорректные записи набора (число, null) пропускаем, как и некорректные цвета
+        SimilarColors.palette_index.add(
+            color for palette in palettes if isinstance(palette, (list, tuple)) for color in palette
+        )
+        SimilarColors._indexed_palettes = palettes
+
+    @staticmethod
+    def get_user_index(telegram_id):
+        return SimilarColors.user_indexes.get(telegram_id)
+
+    @staticmethod
+    def build_user_index(telegram_id, colors):
+        index = ColorIndex(Config.SIMILAR_INDEX_CELL)
+        index.add(colors)
+        SimilarColors.user_indexes.set(telegram_id, index)
+        return index
+
+    @staticmethod
+    def add_user_colors(telegram_id, colors):
+        """Дополнить индекс избранного, если он уже построен"""
+        index = SimilarColors.user_indexes.get(telegram_id)
+        if index is not None:
+            index.add(colors)
+
+    @staticmethod
+    def forget_user(telegram_id):
+        SimilarColors.user_indexes.pop(telegram_id)
@@ -0,0 +1,207 @@
+"""Векторные преобразования цветов на NumPy.
+
+Все функции работают сразу с массивами цветов: HEX <-> RGB (uint8, форма (n, 3)),
+RGB <-> HSL и RGB <-> OKLab (float, форма (n, 3)).
+"""
+import numpy as np
+
+_HEX_DIGITS = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+
+# Код символа -> значение шестнадцатеричной цифры (255 - не цифра)
+_HEX_VALUES = np.full(128, 255, dtype=np.uint8)
+for _i, _ch in enumerate('0123456789abcdef'):
+    _HEX_VALUES[ord(_ch)] = _i
+    _HEX_VALUES[ord(_ch.upper())] = _i
+
+# Матрицы OKLab (https://bottosson.github.io/posts/oklab/)
+_RGB_TO_LMS = np.array([
+    [0.4122214708, 0.5363325363, 0.0514459929],
+    [0.2119034982, 0.6806995451, 0.1073969566],
+    [0.0883024619, 0.2817188376, 0.6299787005]
+])
+_LMS_TO_OKLAB = np.array([
+    [0.2104542553, 0.7936177850, -0.0040720468],
+    [1.9779984951, -2.4285922050, 0.4505937099],
+    [0.0259040371, 0.7827717662, -0.8086757660]
+])
+_OKLAB_TO_LMS = np.linalg.inv(_LMS_TO_OKLAB)
+_LMS_TO_RGB = np.linalg.inv(_RGB_TO_LMS)
+
+
+def hex_to_rgb(colors):
+    """Список HEX-строк -> (rgb uint8 (n, 3), маска корректных цветов (n,)).
+
+    Некорректные значения дают (0, 0, 0) и False в маске
+    """
+    n = len(colors)
+    if n == 0:
+        return np.zeros((0, 3), dtype=np.uint8), np.zeros(0, dtype=bool)
+
+    strings = np.asarray(colors, dtype=str)
+    valid = np.char.str_len(strings) >= 7
+    # U7 -> 7 кодов символов на цвет (лишнее обрезается)
+    codes = strings.astype('U7').view(np.uint32).reshape(n, 7)
+    valid &= codes[:, 0] == ord('#')
+
+    digits = codes[:, 1:]
+    ascii_mask = digits < 128
+    values = _HEX_VALUES[np.where(ascii_mask, digits, 0)]
+    valid &= (ascii_mask & (values != 255)).all(axis=1)
+
+    values = np.where(valid[:, None], values, 0).astype(np.uint8)
+    rgb = (values[:, 0::2] << 4) | values[:, 1::2]
+    return rgb, valid
+
+
+def rgb_to_hex(rgb):
+    """RGB uint8 (n, 3) -> список строк вида #RRGGBB"""
+    rgb = np.asarray(rgb, dtype=np.uint8).reshape(-1, 3)
+    out = np.empty((len(rgb), 7), dtype=np.uint8)
+    out[:, 0] = ord('#')
+    out[:, 1::2] = _HEX_DIGITS[rgb >> 4]
+    out[:, 2::2] = _HEX_DIGITS[rgb & 15]
+    return out.view('S7').ravel().astype(str).tolist()
+
+
+def to_uint8(rgb_float):
+    """RGB в [0, 1] -> uint8 с округлением и обрезкой"""
+    return np.clip(np.rint(np.asarray(rgb_float) * 255), 0, 255).astype(np.uint8)
+
+
+def rgb_to_hsl(rgb):
+    """RGB uint8 (n, 3) -> HSL: оттенок в градусах [0, 360), S и L в [0, 1]"""
+    rgb = np.asarray(rgb, dtype=np.float64) / 255
+    high = rgb.max(axis=1)
+    low = rgb.min(axis=1)
+    delta = high - low
+    lightness = (high + low) / 2
+
+    denominator = 1 - np.abs(2 * lightness - 1)
+    saturation = np.divide(delta, denominator, out=np.zeros_like(delta), where=denominator > 1e-12)
+
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    safe_delta = np.where(delta > 0, delta, 1)
+    hue = np.select(
+        [delta == 0, high == r, high == g],
+        [0.0, ((g - b) / safe_delta) % 6, (b - r) / safe_delta + 2],
+        (r - g) / safe_delta + 4
+    ) * 60
+    return np.stack([hue % 360, saturation, lightness], axis=1)
+
+
+def hsl_to_rgb(hsl):
+    """HSL -> RGB uint8 (n, 3)"""
+    hsl = np.asarray(hsl, dtype=np.float64)
+    hue, saturation, lightness = hsl[:, 0] % 360, np.clip(hsl[:, 1], 0, 1), np.clip(hsl[:, 2], 0, 1)
+
+    chroma = (1 - np.abs(2 * lightness - 1)) * saturation
+    sector = hue / 60
+    x = chroma * (1 - np.abs(sector % 2 - 1))
+    zero = np.zeros_like(chroma)
+    index = np.floor(sector).astype(int) % 6
+
+    r = np.choose(index, [chroma, x, zero, zero, x, chroma])
+    g = np.choose(index, [x, chroma, chroma, x, zero, zero])
+    b = np.choose(index, [zero, zero, x, chroma, chroma, x])
+    m = lightness - chroma / 2
+    return to_uint8(np.stack([r + m, g + m, b + m], axis=1))
+
+
+def _srgb_to_linear(values):
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(values):
+    values = np.clip(values, 0, 1)
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * values ** (1 / 2.4) - 0.055)
+
+
+def rgb_to_oklab(rgb):
+    """RGB uint8 (n, 3) -> OKLab (L, a, b)"""
+    linear = _srgb_to_linear(np.asarray(rgb, dtype=np.float64) / 255)
+    lms = np.cbrt(linear @ _RGB_TO_LMS.T)
+    return lms @ _LMS_TO_OKLAB.T
+
+
+def _oklab_to_linear(lab):
+    lms = (np.asarray(lab, dtype=np.float64) @ _OKLAB_TO_LMS.T) ** 3
+    return lms @ _LMS_TO_RGB.T
+
+
+def oklab_to_rgb(lab):
+    """OKLab -> RGB uint8 (n, 3); цвета вне sRGB обрезаются по каналам"""
+    return to_uint8(_linear_to_srgb(_oklab_to_linear(lab)))
+
+
+def oklab_to_oklch(lab):
+    """OKLab -> OKLCh (L, хрома, оттенок в градусах)"""
+    lab = np.asarray(lab, dtype=np.float64)
+    chroma = np.hypot(lab[:, 1], lab[:, 2])
+    hue = np.degrees(np.arctan2(lab[:, 2], lab[:, 1])) % 360
+    return np.stack([lab[:, 0], chroma, hue], axis=1)
+
+
+def oklch_to_oklab(lch):
+    """OKLCh -> OKLab"""
+    lch = np.asarray(lch, dtype=np.float64)
+    hue = np.radians(lch[:, 2])
+    return np.stack([lch[:, 0], lch[:, 1] * np.cos(hue), lch[:, 1] * np.sin(hue)], axis=1)
+
+
+def oklch_to_rgb_in_gamut(lch, steps: int = 8):
+    """OKLCh -> RGB uint8 (n, 3) с сохранением светлоты и оттенка.
+
+    Цвета вне sRGB не обрезаются по каналам (это сдвигает оттенок), а теряют хрому:
+    допустимая доля хромы ищется делением пополам, steps шагов на весь массив сразу
+    """
+    lch = np.array(lch, dtype=np.float64)
+    low = np.zeros(len(lch))
+    high = np.ones(len(lch))
+    inside = _in_gamut(oklch_to_oklab(lch))
+    low[inside] = 1
+    for _ in range(steps):
+        todo = low < high
+        if not todo.any():
+            break
+        middle = (low + high) / 2
+        trial = lch.copy()
+        trial[:, 1] *= middle
+        ok = _in_gamut(oklch_to_oklab(trial)) & todo
+        low = np.where(ok, middle, low)
+        high = np.where(todo & ~ok, middle, high)
+    lch[:, 1] *= low
+    return oklab_to_rgb(oklch_to_oklab(lch))
+
+
+def _in_gamut(lab, eps: float = 1e-4):
+    linear = _oklab_to_linear(lab)
+    return ((linear >= -eps) & (linear <= 1 + eps)).all(axis=1)
+
+
+def scale_rgb(rgb, factor: float):
+    """Умножить каналы на коэффициент (как прежняя кнопка ярче/темнее)"""
+    scaled = (np.asarray(rgb, dtype=np.float64) * factor).astype(np.int64)
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+
+def shift_oklch(rgb, lightness: float = 0.0, saturation: float = 1.0, hue: float = 0.0):
+    """Перцептивная коррекция: сдвиг светлоты, множитель насыщенности, поворот оттенка"""
+    lch = oklab_to_oklch(rgb_to_oklab(rgb))
+    lch[:, 0] = np.clip(lch[:, 0] + lightness, 0, 1)
+    lch[:, 1] = np.maximum(lch[:, 1] * saturation, 0)
+    lch[:, 2] = lch[:, 2] + hue
+    return oklab_to_rgb(oklch_to_oklab(lch))
+
+
+def transform_hex(colors, transform, *args, **kwargs):
+    """Применить преобразование RGB -> RGB к списку HEX-цветов.
+
+    Некорректные значения возвращаются без изменений
+    """
+    rgb, valid = hex_to_rgb(colors)
+    if not valid.any():
+        return list(colors)
+    result = rgb_to_hex(transform(rgb, *args, **kwargs))
+    if valid.all():
+        return result
+    return [new if ok else old for new, old, ok in zip(result, colors, valid.tolist())]
@@ -5,10 +5,94 @@ load_dotenv()
 
 class Config:
     BOT_TOKEN = os.getenv('BOT_TOKEN')
+    # Адрес Bot API (другой - для локального сервера Bot API или нагрузочного теста)
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+    TELEGRAM_FILE_URL = os.getenv('TELEGRAM_FILE_URL', 'https://api.telegram.org/file/bot')
+    
+    # Режим работы: polling (по умолчанию) или webhook
+    BOT_MODE = os.getenv('BOT_MODE', 'polling')
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # публичный адрес, например https://bot.example.com
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+    # Регистрировать ли адрес в Telegram при старте (достаточно одной копии)
+    WEBHOOK_REGISTER = os.getenv('WEBHOOK_REGISTER', '1') == '1'
     
     # Работающие API
-    COLORMIND_API = 'http://colormind.io/api/'
-    COLOR_PALETTES_API = 'https://cdn.jsdelivr.net/gh/Jam3/nice-color-palettes@master/100.json'
+    COLORMIND_API = os.getenv('COLORMIND_API', 'http://colormind.io/api/')
+    COLOR_PALETTES_API = os.getenv('COLOR_PALETTES_API', 'https://cdn.jsdelivr.net/gh/Jam3/nice-color-palettes@master/100.json')
+    
+    # Кэш палитр (секунды)
+    PALETTES_TTL = int(os.getenv('PALETTES_TTL', 3600))
+    PALETTES_STALE_TTL = int(os.getenv('PALETTES_STALE_TTL', 86400))
+    PALETTES_RETRY_BACKOFF = float(os.getenv('PALETTES_RETRY_BACKOFF', 5))
+    PALETTES_RETRY_BACKOFF_MAX = float(os.getenv('PALETTES_RETRY_BACKOFF_MAX', 300))
+    
+    # Пулы заранее полученных палитр Colormind для каждой тематики
+    PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', '1') == '1'
+    PREFETCH_POOL_SIZE = int(os.getenv('PREFETCH_POOL_SIZE', 3))
+    PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', 2))
+    PREFETCH_RATE_PER_SEC = float(os.getenv('PREFETCH_RATE_PER_SEC', 2))
+    PREFETCH_RETRY_DELAY = float(os.getenv('PREFETCH_RETRY_DELAY', 30))
+    
+    # Hedged-запросы к источникам цветов (секунды)
+    HEDGED_REQUESTS = os.getenv('HEDGED_REQUESTS', '1') == '1'
+    HEDGE_DELAY = float(os.getenv('HEDGE_DELAY', 0.5))  # 0 - все источники сразу
+    THEME_DEADLINE = float(os.getenv('THEME_DEADLINE', 4))  # общий лимит на подбор цветов
+    SOURCE_TIMEOUTS = {
+        "colormind": float(os.getenv('COLORMIND_TIMEOUT', 3)),
+        "palettes": float(os.getenv('PALETTES_TIMEOUT', 3))
+    }
+    
+    # Локальный генератор палитр (OKLCh, от локальных палитр тематик) - источник после API;
+    # GENERATOR_FIRST=1 ставит его первым, тогда весь трафик обслуживается без сети
+    GENERATOR_ENABLED = os.getenv('GENERATOR_ENABLED', '1') == '1'
+    GENERATOR_FIRST = os.getenv('GENERATOR_FIRST', '0') == '1'
+    GENERATOR_BATCH = int(os.getenv('GENERATOR_BATCH', 256))  # палитр за одно вычисление
+    
+    # Предохранитель (circuit breaker) для внешних API
+    BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', 0.5))
+    BREAKER_MIN_REQUESTS = int(os.getenv('BREAKER_MIN_REQUESTS', 5))
+    BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', 20))
+    BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', 30))
+    
+    # Ограничение частоты (token bucket): запросов в секунду и запас на всплеск, 0 - без ограничения
+    # Общий лимит на источник: запрос ждет своей очереди не дольше SOURCE_QUEUE_WAIT,
+    # иначе сразу переходим к следующему источнику
+    SOURCE_RATE_LIMITS = {
+        "colormind": (float(os.getenv('COLORMIND_RATE', 5)), int(os.getenv('COLORMIND_BURST', 10))),
+        "palettes": (float(os.getenv('PALETTES_RATE', 1)), int(os.getenv('PALETTES_BURST', 5)))
+    }
+    SOURCE_QUEUE_WAIT = float(os.getenv('SOURCE_QUEUE_WAIT', 1))
+    # На пользователя: выбор тематики (лишние нажатия объединяются в одно) и запись в избранное
+    USER_THEME_RATE = float(os.getenv('USER_THEME_RATE', 0.5))
+    USER_THEME_BURST = int(os.getenv('USER_THEME_BURST', 3))
+    USER_FAVORITES_RATE = float(os.getenv('USER_FAVORITES_RATE', 2))
+    USER_FAVORITES_BURST = int(os.getenv('USER_FAVORITES_BURST', 5))
+    RATE_LIMIT_USERS = int(os.getenv('RATE_LIMIT_USERS', 10000))  # корзин пользователей в памяти
+    
+    # Адаптивные таймауты: перцентиль задержки источника * множитель
+    LATENCY_WINDOW = int(os.getenv('LATENCY_WINDOW', 100))
+    ADAPTIVE_TIMEOUT_PERCENTILE = float(os.getenv('ADAPTIVE_TIMEOUT_PERCENTILE', 95))
+    ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.getenv('ADAPTIVE_TIMEOUT_MULTIPLIER', 3))
+    ADAPTIVE_TIMEOUT_MIN = float(os.getenv('ADAPTIVE_TIMEOUT_MIN', 1))
+    
+    # Поиск похожих цветов
+    SIMILAR_COLORS_COUNT = int(os.getenv('SIMILAR_COLORS_COUNT', 5))
+    SIMILAR_INDEX_CELL = float(os.getenv('SIMILAR_INDEX_CELL', 0.015))  # размер ячейки сетки в OKLab
+    SIMILAR_USER_INDEXES = int(os.getenv('SIMILAR_USER_INDEXES', 1000))
+    
+    # Картинки палитр
+    SWATCH_IMAGES = os.getenv('SWATCH_IMAGES', '1') == '1'
+    SWATCH_WIDTH = int(os.getenv('SWATCH_WIDTH', 800))
+    SWATCH_HEIGHT = int(os.getenv('SWATCH_HEIGHT', 200))
+    SWATCH_COMPRESSION = int(os.getenv('SWATCH_COMPRESSION', 1))  # уровень zlib
+    SWATCH_CACHE_SIZE = int(os.getenv('SWATCH_CACHE_SIZE', 256))  # готовые PNG
+    SWATCH_FILE_ID_CACHE_SIZE = int(os.getenv('SWATCH_FILE_ID_CACHE_SIZE', 10000))
+    
+    # Готовые ответы с палитрами (цвета после "ярче"/"темнее" и текст сообщения)
+    PALETTE_MEMO_SIZE = int(os.getenv('PALETTE_MEMO_SIZE', 4096))
     
     # Тематики (только названия для отображения)
     THEMES = ["education", "bank_finance", "games", "health", 
@@ -26,4 +110,52 @@ class Config:
         "nature": "🌿 Природа"
     }
     
-    DB_PATH = 'data/colors.db'
\ No newline at end of file
+    DB_PATH = os.getenv('DB_PATH', 'data/colors.db')
+    # Снимок палитр рядом с базой
+    PALETTES_SNAPSHOT_PATH = os.path.join(os.path.dirname(DB_PATH), 'palettes.bin')
+    DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+    DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', 8192))
+    DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 64 * 1024 * 1024))
+    
+    # Кэш telegram_id -> users.id
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    USER_CACHE_STATS = os.getenv('USER_CACHE_STATS', '1') == '1'
+    
+    # Избранное: цветов на странице и кэш числа цветов пользователя
+    FAVORITES_PAGE_SIZE = int(os.getenv('FAVORITES_PAGE_SIZE', 20))
+    FAVORITES_COUNT_CACHE_SIZE = int(os.getenv('FAVORITES_COUNT_CACHE_SIZE', 10000))
+    # Сколько секунд верить кэшу числа цветов: базу могут менять другие копии бота
+    FAVORITES_COUNT_TTL = float(os.getenv('FAVORITES_COUNT_TTL', 30))
+    
+    # Экспорт и импорт палитр (CSV, JSON, ASE): палитр за один запрос к базе, ограничения импорта
+    PALETTE_IO_CHUNK = int(os.getenv('PALETTE_IO_CHUNK', 500))
+    PALETTE_MAX_COLORS = int(os.getenv('PALETTE_MAX_COLORS', 16))
+    IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', 20 * 1024 * 1024))  # лимит скачивания Bot API
+    IMPORT_MAX_PALETTES = int(os.getenv('IMPORT_MAX_PALETTES', 10000))
+
+    # Параллельная обработка обновлений (порядок внутри чата сохраняется)
+    CONCURRENT_UPDATES = os.getenv('CONCURRENT_UPDATES', '1') == '1'
+    UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 16))
+    UPDATE_QUEUE_LIMIT = int(os.getenv('UPDATE_QUEUE_LIMIT', 1000))
+    
+    # Состояние диалога пользователя: memory (в процессе) или sqlite (общее для копий бота)
+    SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')
+    SESSION_TTL = int(os.getenv('SESSION_TTL', 86400))
+    SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', 100000))
+    SESSION_LOCAL_TTL = float(os.getenv('SESSION_LOCAL_TTL', 2))  # локальный кэш sqlite-хранилища
+    SESSION_FLUSH_INTERVAL = float(os.getenv('SESSION_FLUSH_INTERVAL', 0.5))
+    SESSION_FLUSH_BATCH = int(os.getenv('SESSION_FLUSH_BATCH', 500))
+    SESSION_PURGE_INTERVAL = float(os.getenv('SESSION_PURGE_INTERVAL', 600))
+    
+    # HTTP-клиент (общая сессия с пулом соединений)
+    HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))
+    HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', 100))
+    HTTP_LIMIT_PER_HOST = int(os.getenv('HTTP_LIMIT_PER_HOST', 10))
+    HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))
+    HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 30))
+    
+    # Метрики: /metrics на webhook-сервере (или на METRICS_PORT) и команда /stats
+    ADMIN_IDS = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if user_id}
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 0))  # 0 - отдельный сервер метрик не нужен
+    # Цель по времени запуска: от старта процесса до готовности принимать обновления (секунды)
+    STARTUP_TARGET = float(os.getenv('STARTUP_TARGET', 1.5))
\ No newline at end of file
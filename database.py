@@ -1,11 +1,14 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
-from sqlalchemy.orm import relationship, sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine, event, select, delete, func, tuple_, Column, Integer, String, DateTime, Float, LargeBinary, ForeignKey, Index, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 from datetime import datetime
+import hashlib
 import os
-
-# Создаем папку для базы данных
-os.makedirs('data', exist_ok=True)
+import threading
+import time
+import metrics
+from config import Config
+from cache import LRUCache
 
 Base = declarative_base()
 
@@ -26,6 +29,12 @@ class User(Base):
 # Таблица 2: Избранные цвета
 class FavoriteColor(Base):
     __tablename__ = 'favorite_colors'
+    __table_args__ = (
+        # Один и тот же цвет хранится у пользователя только один раз
+        Index('ux_favorite_colors_user_hex', 'user_id', 'hex_code', unique=True),
+        # Постраничный вывод: ключ (added_at, id) и hex прямо в индексе, таблицу не читаем
+        Index('ix_favorite_colors_user_page', 'user_id', 'added_at', 'id', 'hex_code'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -35,100 +44,369 @@ class FavoriteColor(Base):
     # Связь
     user = relationship("User", back_populates="favorite_colors")
 
-# Таблица 3: Избранные палитры (пока не используется, но оставим)
+# Таблица 3: Избранные палитры
 class FavoritePalette(Base):
     __tablename__ = 'favorite_palettes'
+    __table_args__ = (
+        # Одна и та же палитра хранится у пользователя только один раз (проверка по хэшу)
+        Index('ux_favorite_palettes_user_hash', 'user_id', 'palette_hash', unique=True),
+        Index('ix_favorite_palettes_user_added', 'user_id', 'added_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     palette_name = Column(String(100))
-    colors = Column(String(500))  # Храним цвета через запятую
+    colors = Column(LargeBinary)  # RGB подряд, по 3 байта на цвет (5 цветов - 15 байт)
+    palette_hash = Column(Integer)  # 64-битный хэш colors, см. palette_hash
     added_at = Column(DateTime, default=datetime.now)
     
     # Связь
     user = relationship("User", back_populates="favorite_palettes")
 
-# Создаем базу данных
-engine = create_engine(f'sqlite:///data/colors.db')
-Base.metadata.create_all(engine)
+# Таблица 4: Состояние диалога (текущая тема и цвета), общее для копий бота
+class SessionRecord(Base):
+    __tablename__ = 'user_sessions'
+    
+    telegram_id = Column(Integer, primary_key=True)
+    data = Column(LargeBinary)  # Упакованное состояние, см. session_store.UserSession
+    expires_at = Column(Float, index=True)  # Unix-время
+
+def pack_palette(colors):
+    """['#RRGGBB', ...] -> байты RGB подряд"""
+    return bytes.fromhex(''.join(color[1:] for color in colors))
+
+def unpack_palette(data):
+    """Байты RGB -> ['#RRGGBB', ...]"""
+    return ['#' + data[i:i + 3].hex().upper() for i in range(0, len(data), 3)]
+
+def palette_hash(data):
+    """Хэш упакованной палитры для проверки дубликатов (знаковое 64-битное число, как INTEGER в SQLite)"""
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Настройки SQLite для каждого нового соединения"""
+    cursor = dbapi_connection.cursor()
+    # WAL: чтения не ждут записи, а коммит не делает fsync всего файла
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={Config.DB_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{Config.DB_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={Config.DB_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+# Время SQL-запросов по типу (SELECT, INSERT, ...).
+# Все запросы идут из одного потока, но стек на соединении работает и без этого
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    metrics.DB_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+def _query_failed(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+    metrics.DB_ERRORS.inc()
+
+def _migrate_palettes_to_blobs(conn):
+    """Пересоздать favorite_palettes в новом формате, перенеся старые палитры"""
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(favorite_palettes)"))}
+    if 'palette_hash' in columns:
+        return
+    rows = conn.execute(text(
+        "SELECT user_id, palette_name, colors, added_at FROM favorite_palettes ORDER BY id"
+    )).all()
+    conn.execute(text("DROP TABLE favorite_palettes"))
+    FavoritePalette.__table__.create(conn)
+    
+    palettes = []
+    for user_id, name, colors, added_at in rows:
+        hex_codes = [color.strip().upper() for color in (colors or '').split(',') if color.strip()]
+        try:
+            data = pack_palette(hex_codes)
+        except ValueError:
+            continue
+        if data and len(data) == 3 * len(hex_codes):
+            palettes.append({"user_id": user_id, "palette_name": name, "colors": data,
+                             "palette_hash": palette_hash(data), "added_at": added_at})
+    if palettes:
+        # added_at переносится как есть (строкой), поэтому вставка обычным SQL
+        conn.execute(text(
+            "INSERT OR IGNORE INTO favorite_palettes (user_id, palette_name, colors, palette_hash, added_at) "
+            "VALUES (:user_id, :palette_name, :colors, :palette_hash, :added_at)"
+        ), palettes)
+
+# Миграции для уже существующих файлов colors.db.
+# Номер последней примененной миграции хранится в PRAGMA user_version
+MIGRATIONS = [
+    # 1: один цвет у пользователя хранится один раз
+    [
+        "DELETE FROM favorite_colors WHERE id NOT IN "
+        "(SELECT MIN(id) FROM favorite_colors GROUP BY user_id, hex_code)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_favorite_colors_user_hex "
+        "ON favorite_colors (user_id, hex_code)",
+    ],
+    # 2: индексы для выборок избранного по пользователю
+    [
+        "CREATE INDEX IF NOT EXISTS ix_favorite_colors_user_added "
+        "ON favorite_colors (user_id, added_at)",
+        "CREATE INDEX IF NOT EXISTS ix_favorite_palettes_user_added "
+        "ON favorite_palettes (user_id, added_at)",
+    ],
+    # 3: раньше в user_id избранного записывался telegram_id, теперь - users.id
+    [
+        "INSERT OR IGNORE INTO users (telegram_id, joined_at) "
+        "SELECT DISTINCT user_id, CURRENT_TIMESTAMP FROM favorite_colors WHERE user_id IS NOT NULL",
+        "INSERT OR IGNORE INTO users (telegram_id, joined_at) "
+        "SELECT DISTINCT user_id, CURRENT_TIMESTAMP FROM favorite_palettes WHERE user_id IS NOT NULL",
+        "UPDATE favorite_colors SET user_id = "
+        "(SELECT id FROM users WHERE users.telegram_id = favorite_colors.user_id)",
+        "UPDATE favorite_palettes SET user_id = "
+        "(SELECT id FROM users WHERE users.telegram_id = favorite_palettes.user_id)",
+    ],
+    # 4: покрывающий индекс для постраничного вывода избранного
+    [
+        "CREATE INDEX IF NOT EXISTS ix_favorite_colors_user_page "
+        "ON favorite_colors (user_id, added_at, id, hex_code)",
+        "DROP INDEX IF EXISTS ix_favorite_colors_user_added",
+    ],
+    # 5: палитры - упакованный RGB и хэш вместо строки через запятую
+    [
+        _migrate_palettes_to_blobs,
+    ],
+]
+
+def migrate(bind):
+    """Применить недостающие миграции схемы (шаг - SQL-строка или функция от соединения)"""
+    with bind.begin() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            conn.execute(text(f"PRAGMA user_version = {number}"))
+
+# Engine создается, а схема проверяется при первом обращении к базе (init_db),
+# а не при импорте модуля
+engine = None
+Session = sessionmaker()
+_init_lock = threading.Lock()
 
-# Для работы с БД
-Session = sessionmaker(bind=engine)
+def init_db():
+    """Создать engine, таблицы и применить миграции (один раз)"""
+    global engine
+    with _init_lock:
+        if engine is None:
+            os.makedirs(os.path.dirname(Config.DB_PATH) or '.', exist_ok=True)
+            new_engine = create_engine(f'sqlite:///{Config.DB_PATH}')
+            event.listen(new_engine, "connect", _set_sqlite_pragmas)
+            event.listen(new_engine, "before_cursor_execute", _query_started)
+            event.listen(new_engine, "after_cursor_execute", _query_finished)
+            event.listen(new_engine, "handle_error", _query_failed)
+            Base.metadata.create_all(new_engine)
+            migrate(new_engine)
+            Session.configure(bind=new_engine)
+            engine = new_engine
+    return engine
+
+# Кэш telegram_id -> users.id, заполняется при первом обращении пользователя.
+# Используется только из потока БД
+user_id_cache = LRUCache(Config.USER_CACHE_SIZE, track_stats=Config.USER_CACHE_STATS)
+
+# Кэш users.id -> (число избранных цветов, до какого времени ему верить), поддерживается
+# при добавлении и очистке. Запись живет FAVORITES_COUNT_TTL: избранное могут менять
+# и другие копии бота с той же базой. Тоже только из потока БД
+favorites_count_cache = LRUCache(Config.FAVORITES_COUNT_CACHE_SIZE)
+
+metrics.register_cache("user_id", user_id_cache)
+metrics.register_cache("favorites_count", favorites_count_cache)
 
 class Database:
     """Класс для работы с базой данных"""
     
     @staticmethod
     def get_session():
+        if engine is None:
+            init_db()
         return Session()
     
     @staticmethod
-    def add_user(telegram_id, username, first_name):
-        """Добавляем пользователя в БД"""
-        session = Session()
+    def optimize():
+        """Обновить статистику планировщика SQLite (вызывается при остановке)"""
+        if engine is None:
+            return
+        with engine.connect() as conn:
+            conn.execute(text("PRAGMA optimize"))
+    
+    @staticmethod
+    def get_user_id(telegram_id, username=None, first_name=None, create=True):
+        """Внутренний id пользователя (users.id) по его telegram_id.
+        
+        Результат кэшируется, поэтому повторные запросы не обращаются к таблице users.
+        Если пользователя нет и create=False, возвращается None
+        """
+        user_id = user_id_cache.get(telegram_id)
+        if user_id is not None:
+            return user_id
+        
+        session = Database.get_session()
         try:
-            # Проверяем, есть ли уже такой пользователь
-            user = session.query(User).filter_by(telegram_id=telegram_id).first()
-            if not user:
-                user = User(
+            user_id = session.execute(
+                select(User.id).where(User.telegram_id == telegram_id)
+            ).scalar()
+            if user_id is None:
+                if not create:
+                    return None
+                session.execute(sqlite_insert(User).values(
                     telegram_id=telegram_id,
                     username=username,
-                    first_name=first_name
-                )
-                session.add(user)
+                    first_name=first_name,
+                    joined_at=datetime.now()
+                ).on_conflict_do_nothing(index_elements=['telegram_id']))
+                user_id = session.execute(
+                    select(User.id).where(User.telegram_id == telegram_id)
+                ).scalar()
                 session.commit()
-            return user
+            user_id_cache.set(telegram_id, user_id)
+            return user_id
         except Exception as e:
             session.rollback()
-            print(f"Ошибка при добавлении пользователя: {e}")
+            print(f"Ошибка при получении пользователя: {e}")
             return None
         finally:
             session.close()
     
     @staticmethod
-    def add_favorite_color(user_id, color_hex):
+    def add_user(telegram_id, username, first_name):
+        """Добавляем пользователя в БД, возвращаем его внутренний id"""
+        return Database.get_user_id(telegram_id, username, first_name)
+    
+    @staticmethod
+    def add_favorite_color(telegram_id, color_hex):
         """Добавляем цвет в избранное"""
-        session = Session()
+        saved, _ = Database.add_favorite_colors(telegram_id, [color_hex])
+        return saved > 0
+    
+    @staticmethod
+    def add_favorite_colors(telegram_id, colors):
+        """Добавляем несколько цветов в избранное одной транзакцией.
+        
+        Возвращает пару (сохранено, пропущено)
+        """
+        # Убираем дубликаты в памяти, сохраняя порядок
+        unique_colors = list(dict.fromkeys(color.upper() for color in colors if color))
+        user_id = Database.get_user_id(telegram_id)
+        if not unique_colors or user_id is None:
+            return 0, len(colors)
+        
+        session = Database.get_session()
         try:
-            # Проверяем, нет ли уже такого цвета у пользователя
-            existing = session.query(FavoriteColor).filter_by(
-                user_id=user_id,
-                hex_code=color_hex.upper()
-            ).first()
-            
-            if not existing:
-                favorite = FavoriteColor(user_id=user_id, hex_code=color_hex.upper())
-                session.add(favorite)
-                session.commit()
-                return True
-            return False
+            now = datetime.now()
+            stmt = sqlite_insert(FavoriteColor).values([
+                {"user_id": user_id, "hex_code": color, "added_at": now}
+                for color in unique_colors
+            ]).on_conflict_do_nothing(index_elements=['user_id', 'hex_code'])
+            result = session.execute(stmt)
+            session.commit()
+            saved = result.rowcount
+            entry = favorites_count_cache.get(user_id)
+            if entry is not None:
+                favorites_count_cache.set(user_id, (entry[0] + saved, entry[1]))
+            return saved, len(colors) - saved
         except Exception as e:
             session.rollback()
-            print(f"Ошибка при добавлении цвета в избранное: {e}")
-            return False
+            print(f"Ошибка при добавлении цветов в избранное: {e}")
+            return 0, len(colors)
         finally:
             session.close()
     
     @staticmethod
-    def get_user_favorite_colors(user_id):
+    def get_user_favorite_colors(telegram_id):
         """Получить избранные цвета пользователя"""
-        session = Session()
+        user_id = Database.get_user_id(telegram_id, create=False)
+        if user_id is None:
+            return []
+        
+        session = Database.get_session()
+        try:
+            return session.execute(
+                select(FavoriteColor.hex_code)
+                .where(FavoriteColor.user_id == user_id)
+                .order_by(FavoriteColor.added_at.desc(), FavoriteColor.id.desc())
+            ).scalars().all()
+        finally:
+            session.close()
+    
+    @staticmethod
+    def get_user_favorite_colors_page(telegram_id, before=None, after=None, limit=20):
+        """Страница избранных цветов, новые сначала.
+        
+        Keyset-пагинация по (added_at, id): before - ключ последнего цвета предыдущей
+        страницы (листаем вперед), after - ключ первого цвета следующей (листаем назад).
+        Возвращает список пар (HEX, ключ)
+        """
+        user_id = Database.get_user_id(telegram_id, create=False)
+        if user_id is None:
+            return []
+        
+        key = tuple_(FavoriteColor.added_at, FavoriteColor.id)
+        query = select(FavoriteColor.hex_code, FavoriteColor.added_at, FavoriteColor.id).where(FavoriteColor.user_id == user_id)
+        if after is not None:
+            query = query.where(key > tuple_(*after)).order_by(FavoriteColor.added_at, FavoriteColor.id)
+        else:
+            if before is not None:
+                query = query.where(key < tuple_(*before))
+            query = query.order_by(FavoriteColor.added_at.desc(), FavoriteColor.id.desc())
+        
+        session = Database.get_session()
+        try:
+            rows = session.execute(query.limit(limit)).all()
+        finally:
+            session.close()
+        if after is not None:
+            rows.reverse()
+        return [(hex_code, (added_at, row_id)) for hex_code, added_at, row_id in rows]
+    
+    @staticmethod
+    def count_user_favorite_colors(telegram_id):
+        """Число избранных цветов (кэшируется на FAVORITES_COUNT_TTL секунд)"""
+        user_id = Database.get_user_id(telegram_id, create=False)
+        if user_id is None:
+            return 0
+        
+        entry = favorites_count_cache.get(user_id)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        session = Database.get_session()
         try:
-            favorites = session.query(FavoriteColor).filter_by(user_id=user_id).order_by(FavoriteColor.added_at.desc()).all()
-            return [fav.hex_code for fav in favorites]
+            count = session.execute(
+                select(func.count()).select_from(FavoriteColor).where(FavoriteColor.user_id == user_id)
+            ).scalar()
         finally:
             session.close()
+        favorites_count_cache.set(user_id, (count, time.monotonic() + Config.FAVORITES_COUNT_TTL))
+        return count
     
     @staticmethod
-    def clear_user_favorites(user_id):
+    def clear_user_favorites(telegram_id):
         """Очистить все избранное пользователя"""
-        session = Session()
+        user_id = Database.get_user_id(telegram_id, create=False)
+        if user_id is None:
+            return True
+        
+        session = Database.get_session()
         try:
             # Удаляем цвета
             session.query(FavoriteColor).filter_by(user_id=user_id).delete()
             # Удаляем палитры
             session.query(FavoritePalette).filter_by(user_id=user_id).delete()
             session.commit()
+            favorites_count_cache.set(user_id, (0, time.monotonic() + Config.FAVORITES_COUNT_TTL))
             return True
         except Exception as e:
             session.rollback()
@@ -138,12 +416,132 @@ class Database:
             session.close()
     
     @staticmethod
-    def get_user_stats(user_id):
+    def add_favorite_palettes(telegram_id, palettes):
+        """Добавить палитры [(название, ['#RRGGBB', ...]), ...] одной транзакцией.
+        
+        Дубликаты (в том числе уже сохраненные) отсеивает уникальный индекс по хэшу.
+        Возвращает пару (сохранено, пропущено)
+        """
+        user_id = Database.get_user_id(telegram_id)
+        if not palettes or user_id is None:
+            return 0, len(palettes)
+        
+        now = datetime.now()
+        rows = {}
+        for name, colors in palettes:
+            data = pack_palette(colors)
+            rows.setdefault(palette_hash(data), {
+                "user_id": user_id, "palette_name": name[:100] if name else None,
+                "colors": data, "palette_hash": palette_hash(data), "added_at": now
+            })
+        
+        session = Database.get_session()
+        try:
+            result = session.execute(sqlite_insert(FavoritePalette).values(list(rows.values()))
+                                     .on_conflict_do_nothing(index_elements=['user_id', 'palette_hash']))
+            session.commit()
+            saved = result.rowcount
+            return saved, len(palettes) - saved
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка при добавлении палитр в избранное: {e}")
+            return 0, len(palettes)
+        finally:
+            session.close()
+    
+    @staticmethod
+    def get_user_favorite_palettes_chunk(telegram_id, after=None, limit=500):
+        """Следующая пачка палитр пользователя, старые сначала.
+        
+        Keyset по (added_at, id): after - ключ последней палитры предыдущей пачки.
+        Возвращает список (название, цвета, ключ)
+        """
+        user_id = Database.get_user_id(telegram_id, create=False)
+        if user_id is None:
+            return []
+        
+        query = (select(FavoritePalette.palette_name, FavoritePalette.colors,
+                        FavoritePalette.added_at, FavoritePalette.id)
+                 .where(FavoritePalette.user_id == user_id))
+        if after is not None:
+            query = query.where(tuple_(FavoritePalette.added_at, FavoritePalette.id) > tuple_(*after))
+        query = query.order_by(FavoritePalette.added_at, FavoritePalette.id).limit(limit)
+        
+        session = Database.get_session()
+        try:
+            rows = session.execute(query).all()
+        finally:
+            session.close()
+        return [(name or "", unpack_palette(data), (added_at, row_id)) for name, data, added_at, row_id in rows]
+    
+    @staticmethod
+    def get_user_stats(telegram_id):
         """Получить статистику пользователя"""
-        session = Session()
+        user_id = Database.get_user_id(telegram_id, create=False)
+        if user_id is None:
+            return 0, 0
+        
+        color_count = Database.count_user_favorite_colors(telegram_id)
+        session = Database.get_session()
         try:
-            color_count = session.query(FavoriteColor).filter_by(user_id=user_id).count()
             palette_count = session.query(FavoritePalette).filter_by(user_id=user_id).count()
             return color_count, palette_count
+        finally:
+            session.close()
+    @staticmethod
+    def load_session(telegram_id, now):
+        """Упакованное состояние пользователя (None, если нет или истекло)"""
+        session = Database.get_session()
+        try:
+            return session.execute(
+                select(SessionRecord.data).where(
+                    SessionRecord.telegram_id == telegram_id,
+                    SessionRecord.expires_at > now
+                )
+            ).scalar()
+        finally:
+            session.close()
+    
+    @staticmethod
+    def save_sessions(rows):
+        """Записать пачку состояний одной транзакцией.
+        
+        rows - список (telegram_id, data, expires_at); data=None удаляет запись
+        """
+        upserts = [
+            {"telegram_id": telegram_id, "data": data, "expires_at": expires_at}
+            for telegram_id, data, expires_at in rows if data is not None
+        ]
+        deletes = [telegram_id for telegram_id, data, _ in rows if data is None]
+        
+        session = Database.get_session()
+        try:
+            if upserts:
+                stmt = sqlite_insert(SessionRecord)
+                session.execute(stmt.on_conflict_do_update(
+                    index_elements=['telegram_id'],
+                    set_={"data": stmt.excluded.data, "expires_at": stmt.excluded.expires_at}
+                ), upserts)
+            if deletes:
+                session.execute(delete(SessionRecord).where(SessionRecord.telegram_id.in_(deletes)))
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка при сохранении сессий: {e}")
+            return False
+        finally:
+            session.close()
+    
+    @staticmethod
+    def purge_sessions(now):
+        """Удалить истекшие состояния"""
+        session = Database.get_session()
+        try:
+            session.execute(delete(SessionRecord).where(SessionRecord.expires_at <= now))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"Ошибка при очистке сессий: {e}")
         finally:
             session.close()
\ No newline at end of file
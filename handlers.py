@@ -1,45 +1,76 @@
-from telegram import Update, ReplyKeyboardMarkup
+import aiohttp
+import asyncio
+import itertools
+import math
+import os
+import re
+import tempfile
+from telegram import Update
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import ContextTypes
 from api_client import ColorAPIClient
-from database import Database
+from async_database import AsyncDatabase
+from color_index import SimilarColors
+from palette_memo import PaletteMemo
+import palette_io
+from resilience import Coalescer, RateLimiter
+from session_store import UserSession, create_session_store
+from swatch import SwatchCache
+from update_processor import ChatShardedUpdateProcessor, sleep_without_slot
+import metrics
 from config import Config
+from routing import Router, rows
+
+# Подписи кнопок (кнопки тематик - это Config.THEME_DESCRIPTIONS)
+BTN_BRIGHTER = "➕ Ярче"
+BTN_DARKER = "➖ Темнее"
+BTN_SAVE_ALL = "⭐ Добавить все"
+BTN_SAVE_PALETTE = "🎨 Сохранить палитру"
+BTN_FAVORITES = "⭐ Избранное"
+BTN_MY_COLORS = "📋 Мои цвета"
+BTN_NEXT_PAGE = "➡️ Следующие"
+BTN_PREV_PAGE = "⬅️ Предыдущие"
+BTN_CLEAR = "🗑️ Очистить"
+BTN_CONFIRM_CLEAR = "✅ Да, очистить всё"
+BTN_CANCEL_CLEAR = "❌ Нет, оставить"
+BTN_HOME = "🏠 Главное меню"
+BTN_HELP = "❓ Помощь"
+
+# HEX-код цвета, например #FF5733
+HEX_COLOR_PATTERN = r"#[0-9A-Fa-f]{6}"
 
 class Handlers:
     """Все обработчики бота"""
     
-    # Главное меню - выбор тематики
-    MAIN_KEYBOARD = [
-        ["🎓 Образование", "🏦 Банк/Финансы"],
-        ["🎮 Игры", "🏥 Здоровье"],
-        ["🍕 Еда", "💻 Технологии"],
-        ["👗 Мода", "🌿 Природа"],
-        ["⭐ Избранное", "❓ Помощь"]
-    ]
+    # Текущая тема и цвета пользователей (вместо context.user_data)
+    sessions = create_session_store()
     
-    # После выбора темы
-    COLORS_KEYBOARD = [
-        ["➕ Ярче", "➖ Темнее"],
-        ["⭐ Добавить все", "🏠 Главное меню"]
-    ]
+    # Лимиты частоты на пользователя: выбор тематики (лишние нажатия объединяются
+    # в одно, показывается последняя тематика) и запись в избранное (ждет очереди,
+    # не занимая слот воркера)
+    theme_limiter = RateLimiter(Config.USER_THEME_RATE, Config.USER_THEME_BURST, Config.RATE_LIMIT_USERS)
+    theme_requests = Coalescer()
+    favorites_limiter = RateLimiter(Config.USER_FAVORITES_RATE, Config.USER_FAVORITES_BURST, Config.RATE_LIMIT_USERS)
     
-    # Меню избранного
-    FAVORITES_KEYBOARD = [
-        ["📋 Мои цвета", "🗑️ Очистить"],
-        ["🏠 Главное меню"]
-    ]
+    # Кнопки, шаблоны и команды -> обработчики (заполняется в конце модуля)
+    router = Router()
     
-    # Подтверждение очистки
-    CONFIRM_KEYBOARD = [
-        ["✅ Да, очистить всё", "❌ Нет, оставить"],
-        ["🏠 Главное меню"]
-    ]
+    # Готовые клавиатуры, собираются один раз после регистрации маршрутов
+    MAIN_KEYBOARD = None  # главное меню - выбор тематики
+    COLORS_KEYBOARD = None  # после выбора темы
+    FAVORITES_KEYBOARD = None  # меню избранного
+    FAVORITES_PAGE_KEYBOARD = None  # листание избранного
+    CONFIRM_KEYBOARD = None  # подтверждение очистки
+    HOME_KEYBOARD = None  # только возврат в главное меню
 
     @staticmethod
+    @metrics.track_latency
     async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начало работы"""
         user = update.effective_user
-        Database.add_user(user.id, user.username, user.first_name)
-        context.user_data.clear()
+        await AsyncDatabase.add_user(user.id, user.username, user.first_name)
+        await Handlers.sessions.delete(user.id)
+        Handlers.theme_requests.cancel(user.id)
         
         text = """🎨 <b>Color Bot</b>
 
@@ -47,73 +78,57 @@ class Handlers:
 
         await update.message.reply_text(
             text,
-            reply_markup=ReplyKeyboardMarkup(Handlers.MAIN_KEYBOARD, resize_keyboard=True),
+            reply_markup=Handlers.MAIN_KEYBOARD,
             parse_mode='HTML'
         )
 
     @staticmethod
+    @metrics.track_latency
     async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработка текстовых сообщений"""
-        text = update.message.text
-        
-        # Обработка выбора тематики
-        theme_map = {
-            "🎓 Образование": "education",
-            "🏦 Банк/Финансы": "bank_finance",
-            "🎮 Игры": "games", 
-            "🏥 Здоровье": "health",
-            "🍕 Еда": "food",
-            "💻 Технологии": "technology",
-            "👗 Мода": "fashion",
-            "🌿 Природа": "nature"
-        }
-        
-        if text in theme_map:
-            await Handlers.select_theme(update, context, theme_map[text])
-            return
+        """Обработка текстовых сообщений: кнопки и HEX-коды по таблице Handlers.router"""
+        if not await Handlers.router.dispatch(update, context):
+            await update.message.reply_text("Используйте кнопки меню или отправьте цвет в формате #FF5733")
+
+    @staticmethod
+    @metrics.track_latency
+    async def select_theme(update: Update, context: ContextTypes.DEFAULT_TYPE, theme: str):
+        """Выбор тематики (не чаще лимита пользователя)"""
+        user_id = update.effective_user.id
         
-        # Обработка действий с цветами
-        if text == "➕ Ярче":
-            await Handlers.adjust_colors(update, context, "brighter")
-            return
-        elif text == "➖ Темнее":
-            await Handlers.adjust_colors(update, context, "darker")
-            return
-        elif text == "⭐ Добавить все":
-            await Handlers.save_all_colors(update, context)
-            return
-        elif text == "⭐ Избранное":
-            await Handlers.show_favorites_menu(update, context)
-            return
-        elif text == "📋 Мои цвета":
-            await Handlers.show_my_colors(update, context)
-            return
-        elif text == "🗑️ Очистить":
-            await Handlers.confirm_clear_favorites(update, context)
-            return
-        elif text == "✅ Да, очистить всё":
-            await Handlers.clear_favorites(update, context)
-            return
-        elif text == "❌ Нет, оставить":
-            await Handlers.show_favorites_menu(update, context)
-            return
-        elif text == "🏠 Главное меню":
-            await Handlers.start(update, context)
-            return
-        elif text == "❓ Помощь":
-            await Handlers.show_help(update, context)
+        # Предыдущее нажатие еще ждет своей очереди - ответим один раз, на последнюю тематику
+        if Handlers.theme_requests.replace(user_id, Handlers.show_theme_in_chat, update, context, theme):
+            metrics.RATE_LIMITED.inc(limit="user_theme", outcome="coalesced")
             return
         
-        # Обработка ввода цвета (например #FF5733)
-        if text.startswith("#") and len(text) == 7:
-            await Handlers.add_color_to_favorites(update, context, text)
+        wait = Handlers.theme_limiter.reserve(user_id)
+        if wait:
+            metrics.RATE_LIMITED.inc(limit="user_theme", outcome="queued")
+            Handlers.theme_requests.submit(user_id, wait, Handlers.show_theme_in_chat, update, context, theme)
+            await update.message.reply_text(
+                f"⏳ Слишком часто! Цвета для последней выбранной тематики пришлю через {math.ceil(wait)} с"
+            )
             return
         
-        await update.message.reply_text("Используйте кнопки меню или отправьте цвет в формате #FF5733")
+        await Handlers.show_theme(update, context, theme)
 
     @staticmethod
-    async def select_theme(update: Update, context: ContextTypes.DEFAULT_TYPE, theme: str):
-        """Выбор тематики"""
+    async def show_theme_in_chat(update: Update, context: ContextTypes.DEFAULT_TYPE, theme: str):
+        """Отложенный показ тематики - в очереди обновлений чата.
+        
+        Так он не пересекается с другими обработчиками этого чата: кнопки, нажатые
+        во время ожидания (например, «Ярче»), относятся к прежней палитре, а новая
+        палитра показывается после них
+        """
+        processor = context.application.update_processor
+        if isinstance(processor, ChatShardedUpdateProcessor):
+            processor.enqueue(update, Handlers.show_theme(update, context, theme))
+        else:
+            await Handlers.show_theme(update, context, theme)
+
+    @staticmethod
+    @metrics.track_latency
+    async def show_theme(update: Update, context: ContextTypes.DEFAULT_TYPE, theme: str):
+        """Подобрать и показать цвета тематики"""
         theme_desc = Config.THEME_DESCRIPTIONS.get(theme, theme)
         
         await update.message.reply_text(f"🔄 Получаю цвета для {theme_desc}...")
@@ -125,80 +140,94 @@ class Handlers:
             await update.message.reply_text(
                 f"❌ Не удалось получить цвета для {theme_desc}\n"
                 "Попробуйте позже.",
-                reply_markup=ReplyKeyboardMarkup([["🏠 Главное меню"]], resize_keyboard=True)
+                reply_markup=Handlers.HOME_KEYBOARD
             )
             return
         
-        # Сохраняем в контексте
-        context.user_data['current_theme'] = theme
-        context.user_data['current_colors'] = colors
-        context.user_data['theme_desc'] = theme_desc
+        # Сохраняем состояние пользователя
+        await Handlers.sessions.set(update.effective_user.id, UserSession(theme, colors))
         
         # Показываем цвета
-        message = f"🎨 <b>Цвета для {theme_desc}:</b>\n\n"
-        
-        for i, color in enumerate(colors, 1):
-            message += f"{i}. <code>{color}</code>\n"
+        message = PaletteMemo.theme(colors, f"Цвета для {theme_desc}")
         
-        message += "\nВыберите действие:"
-        
-        await update.message.reply_text(
-            message,
-            reply_markup=ReplyKeyboardMarkup(Handlers.COLORS_KEYBOARD, resize_keyboard=True),
-            parse_mode='HTML'
+        await Handlers.send_palette(
+            update, colors, message,
+            Handlers.COLORS_KEYBOARD
         )
 
     @staticmethod
+    @metrics.track_latency
     async def adjust_colors(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str):
         """Изменение яркости цветов"""
-        if 'current_colors' not in context.user_data:
+        session = await Handlers.sessions.get(update.effective_user.id)
+        if session is None or not session.colors:
             await update.message.reply_text("Сначала выберите тематику!")
             return
         
-        colors = context.user_data['current_colors']
+        colors = session.colors
         action_text = "ярче" if action == "brighter" else "темнее"
         
         await update.message.reply_text(f"🔄 Делаю цвета {action_text}...")
         
-        # Изменяем цвета
-        adjusted_colors = ColorAPIClient.adjust_colors(colors, action)
+        # Изменяем цвета (повторные палитры и нажатия берутся из кэша вместе с текстом)
+        adjusted_colors, message = PaletteMemo.adjust(
+            colors, action, f"Цвета для {session.theme_desc} ({action_text})"
+        )
         
-        # Обновляем в контексте
-        context.user_data['current_colors'] = adjusted_colors
+        # Обновляем состояние
+        session.colors = adjusted_colors
+        await Handlers.sessions.set(update.effective_user.id, session)
         
         # Показываем обновленные цвета
-        theme_desc = context.user_data.get('theme_desc', 'темы')
-        message = f"🎨 <b>Цвета для {theme_desc} ({action_text}):</b>\n\n"
-        
-        for i, color in enumerate(adjusted_colors, 1):
-            message += f"{i}. <code>{color}</code>\n"
-        
-        message += "\nВыберите действие:"
-        
-        await update.message.reply_text(
-            message,
-            reply_markup=ReplyKeyboardMarkup(Handlers.COLORS_KEYBOARD, resize_keyboard=True),
-            parse_mode='HTML'
+        await Handlers.send_palette(
+            update, adjusted_colors, message,
+            Handlers.COLORS_KEYBOARD
         )
 
     @staticmethod
+    @metrics.track_latency
+    async def send_palette(update: Update, colors: list, message: str, reply_markup):
+        """Отправить палитру картинкой с подписью (или текстом, если картинки выключены).
+        
+        Уже отправленная палитра уходит по file_id, новая рисуется и загружается один раз
+        """
+        if not Config.SWATCH_IMAGES:
+            await update.message.reply_text(message, reply_markup=reply_markup, parse_mode='HTML')
+            return
+        
+        file_id = SwatchCache.get_file_id(colors)
+        if file_id is not None:
+            try:
+                await update.message.reply_photo(file_id, caption=message, reply_markup=reply_markup, parse_mode='HTML')
+                return
+            except BadRequest:
+                # file_id больше не действителен - загрузим картинку заново
+                SwatchCache.forget_file_id(colors)
+        
+        try:
+            image = await SwatchCache.get_image(colors)
+        except ValueError:
+            await update.message.reply_text(message, reply_markup=reply_markup, parse_mode='HTML')
+            return
+        sent = await update.message.reply_photo(image, caption=message, reply_markup=reply_markup, parse_mode='HTML')
+        if sent is not None and sent.photo:
+            SwatchCache.set_file_id(colors, sent.photo[-1].file_id)
+
+    @staticmethod
+    @metrics.track_latency
     async def save_all_colors(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Сохранить все текущие цвета в избранное"""
-        if 'current_colors' not in context.user_data:
+        user = update.effective_user
+        session = await Handlers.sessions.get(user.id)
+        if session is None or not session.colors:
             await update.message.reply_text("Сначала выберите тематику!")
             return
         
-        colors = context.user_data['current_colors']
-        user = update.effective_user
-        
-        saved = 0
-        skipped = 0
+        colors = session.colors
         
-        for color in colors:
-            if Database.add_favorite_color(user.id, color.upper()):
-                saved += 1
-            else:
-                skipped += 1
+        await Handlers.wait_favorites_turn(user.id)
+        saved, skipped = await AsyncDatabase.add_favorite_colors(user.id, colors)
+        SimilarColors.add_user_colors(user.id, colors)
         
         if saved > 0:
             await update.message.reply_text(f"✅ Сохранено {saved} цветов в избранное!")
@@ -206,62 +235,302 @@ class Handlers:
             await update.message.reply_text("ℹ️ Все цвета уже были в избранном")
 
     @staticmethod
+    @metrics.track_latency
     async def add_color_to_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE, color: str):
         """Добавить один цвет в избранное"""
         user = update.effective_user
         
-        if Database.add_favorite_color(user.id, color.upper()):
+        await Handlers.wait_favorites_turn(user.id)
+        if await AsyncDatabase.add_favorite_color(user.id, color.upper()):
+            SimilarColors.add_user_colors(user.id, [color])
             await update.message.reply_text(f"✅ Цвет {color} добавлен в избранное!")
         else:
             await update.message.reply_text(f"ℹ️ Цвет {color} уже в избранном")
 
     @staticmethod
+    @metrics.track_latency
+    async def save_palette(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Сохранить текущую палитру целиком"""
+        user = update.effective_user
+        session = await Handlers.sessions.get(user.id)
+        if session is None or not session.colors:
+            await update.message.reply_text("Сначала выберите тематику!")
+            return
+        
+        await Handlers.wait_favorites_turn(user.id)
+        saved, _ = await AsyncDatabase.add_favorite_palettes(user.id, [(session.theme_desc, session.colors)])
+        
+        if saved:
+            await update.message.reply_text("✅ Палитра сохранена! Выгрузить палитры: /export")
+        else:
+            await update.message.reply_text("ℹ️ Эта палитра уже сохранена")
+
+    @staticmethod
+    @metrics.track_latency
+    async def export_palettes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выгрузить сохраненные палитры файлом: /export csv|json|ase"""
+        user = update.effective_user
+        fmt = context.args[0].lower() if context.args else "json"
+        if fmt not in palette_io.FORMATS:
+            await update.message.reply_text("Укажите формат: /export csv, /export json или /export ase")
+            return
+        
+        _, palette_count = await AsyncDatabase.get_user_stats(user.id)
+        if not palette_count:
+            await update.message.reply_text("ℹ️ Сохраненных палитр пока нет")
+            return
+        
+        # Палитры читаются из базы пачками и сразу дописываются во временный файл
+        with tempfile.TemporaryFile() as file:
+            writer = palette_io.open_writer(fmt, file)
+            after = None
+            while True:
+                chunk = await AsyncDatabase.get_user_favorite_palettes_chunk(user.id, after, Config.PALETTE_IO_CHUNK)
+                if not chunk:
+                    break
+                writer.write([(name, colors) for name, colors, _ in chunk])
+                after = chunk[-1][2]
+            writer.close()
+            file.seek(0)
+            await update.message.reply_document(
+                file, filename=f"palettes.{fmt}", caption=f"🎨 Палитр: {palette_count}"
+            )
+
+    @staticmethod
+    @metrics.track_latency
+    async def show_import_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Как импортировать палитры"""
+        await update.message.reply_text(
+            "📥 Отправьте файл с палитрами: .csv, .json или .ase "
+            "(например, выгруженный командой /export)"
+        )
+
+    @staticmethod
+    @metrics.track_latency
+    async def import_palettes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Импорт палитр из присланного файла (CSV, JSON, ASE)"""
+        user = update.effective_user
+        document = update.message.document
+        fmt = os.path.splitext(document.file_name or "")[1].lstrip(".").lower()
+        if fmt not in palette_io.FORMATS:
+            await update.message.reply_text("Поддерживаются файлы .csv, .json и .ase")
+            return
+        if document.file_size and document.file_size > Config.IMPORT_MAX_BYTES:
+            await update.message.reply_text("❌ Файл слишком большой")
+            return
+        
+        await Handlers.wait_favorites_turn(user.id)
+        await update.message.reply_text("🔄 Импортирую палитры...")
+        
+        saved = skipped = total = 0
+        truncated = False
+        with tempfile.TemporaryFile() as file:
+            try:
+                await Handlers.download_document(document, file)
+            except ValueError as e:
+                await update.message.reply_text(f"❌ {e}")
+                return
+            except (TelegramError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Ошибка при скачивании файла: {type(e).__name__}: {e}")
+                await update.message.reply_text("❌ Не удалось скачать файл, попробуйте позже")
+                return
+            file.seek(0)
+            
+            # Файл разбирается в отдельном потоке пачками, каждая пачка - одна транзакция
+            palettes = palette_io.read_palettes(fmt, file, Config.PALETTE_MAX_COLORS)
+            try:
+                while total < Config.IMPORT_MAX_PALETTES:
+                    limit = min(Config.PALETTE_IO_CHUNK, Config.IMPORT_MAX_PALETTES - total)
+                    chunk = await asyncio.to_thread(lambda: list(itertools.islice(palettes, limit)))
+                    if not chunk:
+                        break
+                    total += len(chunk)
+                    valid = [palette for palette in chunk if palette is not None]
+                    skipped += len(chunk) - len(valid)
+                    if valid:
+                        chunk_saved, chunk_skipped = await AsyncDatabase.add_favorite_palettes(user.id, valid)
+                        saved += chunk_saved
+                        skipped += chunk_skipped
+                # Ровно IMPORT_MAX_PALETTES палитр - это еще не обрезка: есть ли следующая
+                if total >= Config.IMPORT_MAX_PALETTES:
+                    truncated = await asyncio.to_thread(lambda: any(True for _ in itertools.islice(palettes, 1)))
+            except ValueError as e:
+                await update.message.reply_text(f"❌ Не удалось прочитать файл: {e}\nСохранено палитр: {saved}")
+                return
+            finally:
+                palettes.close()
+        
+        text = f"✅ Импортировано палитр: {saved}"
+        if skipped:
+            text += f"\nПропущено (дубликаты или ошибки): {skipped}"
+        if truncated:
+            text += f"\nЗа один раз импортируется не больше {Config.IMPORT_MAX_PALETTES} палитр"
+        await update.message.reply_text(text)
+
+    @staticmethod
+    async def download_document(document, file):
+        """Скачать присланный файл в file частями, не держа его в памяти целиком.
+        
+        Файл больше IMPORT_MAX_BYTES - ValueError; ошибки Bot API и сети пробрасываются
+        """
+        telegram_file = await document.get_file()
+        session = await ColorAPIClient.start_session()
+        # Общий таймаут сессии рассчитан на запросы к API, здесь ограничиваем только паузы чтения
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=Config.HTTP_TIMEOUT)
+        size = 0
+        async with session.get(telegram_file.file_path, timeout=timeout) as response:
+            response.raise_for_status()
+            async for part in response.content.iter_chunked(64 * 1024):
+                size += len(part)
+                if size > Config.IMPORT_MAX_BYTES:
+                    raise ValueError("Файл слишком большой")
+                file.write(part)
+
+    @staticmethod
+    async def wait_favorites_turn(telegram_id):
+        """Запись в избранное сверх лимита не отклоняется, а ждет своей очереди.
+        
+        Обновления одного чата обрабатываются по порядку, так что у пользователя
+        в очереди не больше одной записи, а его следующие сообщения ждут за ней.
+        Слот воркера на время ожидания отдается другим чатам
+        """
+        wait = Handlers.favorites_limiter.reserve(telegram_id)
+        if wait:
+            metrics.RATE_LIMITED.inc(limit="user_favorites", outcome="queued")
+            await sleep_without_slot(wait)
+
+    @staticmethod
+    @metrics.track_latency
+    async def find_similar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Найти похожие цвета: /similar #FF5733"""
+        user = update.effective_user
+        color = context.args[0].upper() if context.args else ""
+        if not re.fullmatch(HEX_COLOR_PATTERN, color):
+            await update.message.reply_text("Отправьте команду с цветом, например: /similar #FF5733")
+            return
+        
+        # Общий индекс по палитрам (строится один раз на набор палитр)
+        palettes = await ColorAPIClient.get_color_palettes()
+        SimilarColors.update_palettes(palettes)
+        
+        # Индекс избранного строится при первом поиске и дальше дополняется
+        user_index = SimilarColors.get_user_index(user.id)
+        if user_index is None:
+            favorites = await AsyncDatabase.get_user_favorite_colors(user.id)
+            user_index = SimilarColors.build_user_index(user.id, favorites)
+        
+        k = Config.SIMILAR_COLORS_COUNT
+        from_palettes = [item for item in SimilarColors.palette_index.query(color, k + 1) if item[0] != color][:k]
+        from_favorites = [item for item in user_index.query(color, k + 1) if item[0] != color][:k]
+        
+        if not from_palettes and not from_favorites:
+            await update.message.reply_text(f"ℹ️ Не нашлось цветов, похожих на {color}")
+            return
+        
+        message = f"🔍 <b>Похожие на {color}:</b>\n"
+        if from_palettes:
+            message += "\n<b>Из палитр:</b>\n"
+            for i, (similar, distance) in enumerate(from_palettes, 1):
+                message += f"{i}. <code>{similar}</code> (ΔE {distance * 100:.1f})\n"
+        if from_favorites:
+            message += "\n<b>Из избранного:</b>\n"
+            for i, (similar, distance) in enumerate(from_favorites, 1):
+                message += f"{i}. <code>{similar}</code> (ΔE {distance * 100:.1f})\n"
+        
+        await update.message.reply_text(message, parse_mode='HTML')
+
+    @staticmethod
+    @metrics.track_latency
     async def show_favorites_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать меню избранного"""
         await update.message.reply_text(
             "⭐ <b>Избранное</b>\n\nВыберите действие:",
-            reply_markup=ReplyKeyboardMarkup(Handlers.FAVORITES_KEYBOARD, resize_keyboard=True),
+            reply_markup=Handlers.FAVORITES_KEYBOARD,
             parse_mode='HTML'
         )
 
     @staticmethod
-    async def show_my_colors(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Показать избранные цвета"""
+    @metrics.track_latency
+    async def show_my_colors(update: Update, context: ContextTypes.DEFAULT_TYPE, direction: str = None):
+        """Показать избранные цвета постранично (direction: "next", "prev" или первая страница)"""
         user = update.effective_user
-        favorite_colors = Database.get_user_favorite_colors(user.id)
+        session = await Handlers.sessions.get(user.id) or UserSession()
+        page_size = Config.FAVORITES_PAGE_SIZE
+        
+        # Страница не открыта (или состояние истекло) - начинаем с первой
+        if not session.page:
+            direction = None
+        if direction == "prev" and session.page <= 1:
+            await update.message.reply_text("ℹ️ Это первая страница")
+            return
         
-        if not favorite_colors:
-            message = "⭐ У вас пока нет избранных цветов\n\nОтправьте цвет в формате #FF5733 или выберите тематику"
+        if direction == "next":
+            page_rows = await AsyncDatabase.get_user_favorite_colors_page(user.id, before=session.page_last, limit=page_size)
+            if not page_rows:
+                await update.message.reply_text("ℹ️ Это последняя страница")
+                return
+            page = session.page + 1
+        elif direction == "prev":
+            page_rows = await AsyncDatabase.get_user_favorite_colors_page(user.id, after=session.page_first, limit=page_size)
+            page = session.page - 1
         else:
-            message = f"⭐ <b>Ваши цвета ({len(favorite_colors)}):</b>\n\n"
-            for i, color in enumerate(favorite_colors, 1):
-                message += f"{i}. <code>{color}</code>\n"
+            page_rows = []
+        if not page_rows:
+            page_rows = await AsyncDatabase.get_user_favorite_colors_page(user.id, limit=page_size)
+            page = 1
+        
+        if not page_rows:
+            session.page = 0
+            await Handlers.sessions.set(user.id, session)
+            await update.message.reply_text(
+                "⭐ У вас пока нет избранных цветов\n\nОтправьте цвет в формате #FF5733 или выберите тематику"
+            )
+            return
         
-        await update.message.reply_text(message, parse_mode='HTML')
+        total = await AsyncDatabase.count_user_favorite_colors(user.id)
+        pages = max(1, -(-total // page_size))
+        page = min(page, pages)
+        
+        session.page, session.page_first, session.page_last = page, page_rows[0][1], page_rows[-1][1]
+        await Handlers.sessions.set(user.id, session)
+        
+        if pages > 1:
+            message = f"⭐ <b>Ваши цвета ({total}), страница {page} из {pages}:</b>\n\n"
+            reply_markup = Handlers.FAVORITES_PAGE_KEYBOARD
+        else:
+            message = f"⭐ <b>Ваши цвета ({total}):</b>\n\n"
+            reply_markup = None
+        for i, (color, _) in enumerate(page_rows, (page - 1) * page_size + 1):
+            message += f"{i}. <code>{color}</code>\n"
+        
+        await update.message.reply_text(message, reply_markup=reply_markup, parse_mode='HTML')
 
     @staticmethod
+    @metrics.track_latency
     async def confirm_clear_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Подтверждение очистки избранного"""
         user = update.effective_user
-        color_count, _ = Database.get_user_stats(user.id)
+        color_count, palette_count = await AsyncDatabase.get_user_stats(user.id)
         
-        if color_count == 0:
+        if color_count == 0 and palette_count == 0:
             await update.message.reply_text("ℹ️ Ваше избранное уже пустое")
             return
         
         await update.message.reply_text(
             f"⚠️ Вы уверены, что хотите очистить все избранное?\n"
-            f"Будет удалено {color_count} цветов.\n"
+            f"Будет удалено {color_count} цветов и {palette_count} палитр.\n"
             f"Это действие нельзя отменить!",
-            reply_markup=ReplyKeyboardMarkup(Handlers.CONFIRM_KEYBOARD, resize_keyboard=True)
+            reply_markup=Handlers.CONFIRM_KEYBOARD
         )
 
     @staticmethod
+    @metrics.track_latency
     async def clear_favorites(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Очистить избранное"""
         user = update.effective_user
         
-        if Database.clear_user_favorites(user.id):
+        if await AsyncDatabase.clear_user_favorites(user.id):
+            SimilarColors.forget_user(user.id)
             await update.message.reply_text("✅ Все избранное очищено!")
         else:
             await update.message.reply_text("❌ Не удалось очистить избранное")
@@ -269,6 +538,15 @@ class Handlers:
         await Handlers.start(update, context)
 
     @staticmethod
+    async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Метрики бота (только для Config.ADMIN_IDS)"""
+        if update.effective_user.id not in Config.ADMIN_IDS:
+            await update.message.reply_text("Используйте кнопки меню или отправьте цвет в формате #FF5733")
+            return
+        await update.message.reply_text(metrics.format_stats(), parse_mode='HTML')
+
+    @staticmethod
+    @metrics.track_latency
     async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать справку"""
         help_text = """🎨 <b>Color Bot - помощь</b>
@@ -282,7 +560,55 @@ class Handlers:
 <b>Добавление цветов:</b>
 Отправьте любой HEX-код в формате #FF5733
 
+<b>Похожие цвета:</b>
+/similar #FF5733 - ближайшие цвета из палитр и вашего избранного
+
 <b>Избранное:</b>
-Хранит ваши любимые цвета"""
+Хранит ваши любимые цвета и палитры
+
+<b>Палитры:</b>
+/export csv|json|ase - выгрузить сохраненные палитры файлом
+/import - загрузить палитры из файла"""
         
-        await update.message.reply_text(help_text, parse_mode='HTML')
\ No newline at end of file
+        await update.message.reply_text(help_text, parse_mode='HTML')
+
+
+def _register_routes(router: Router):
+    """Все маршруты бота: добавление кнопки или команды - одна строка здесь"""
+    for theme, label in Config.THEME_DESCRIPTIONS.items():
+        router.button(label, Handlers.select_theme, theme)
+    router.button(BTN_BRIGHTER, Handlers.adjust_colors, "brighter")
+    router.button(BTN_DARKER, Handlers.adjust_colors, "darker")
+    router.button(BTN_SAVE_ALL, Handlers.save_all_colors)
+    router.button(BTN_SAVE_PALETTE, Handlers.save_palette)
+    router.button(BTN_FAVORITES, Handlers.show_favorites_menu)
+    router.button(BTN_MY_COLORS, Handlers.show_my_colors)
+    router.button(BTN_NEXT_PAGE, Handlers.show_my_colors, "next")
+    router.button(BTN_PREV_PAGE, Handlers.show_my_colors, "prev")
+    router.button(BTN_CLEAR, Handlers.confirm_clear_favorites)
+    router.button(BTN_CONFIRM_CLEAR, Handlers.clear_favorites)
+    router.button(BTN_CANCEL_CLEAR, Handlers.show_favorites_menu)
+    router.button(BTN_HOME, Handlers.start)
+    router.button(BTN_HELP, Handlers.show_help)
+    router.pattern(HEX_COLOR_PATTERN, Handlers.add_color_to_favorites)
+    
+    router.command("start", Handlers.start)
+    router.command("help", Handlers.show_help)
+    router.command("favorites", Handlers.show_favorites_menu)
+    router.command("similar", Handlers.find_similar)
+    router.command("stats", Handlers.show_stats)
+    router.command("export", Handlers.export_palettes)
+    router.command("import", Handlers.show_import_help)
+
+_register_routes(Handlers.router)
+
+Handlers.MAIN_KEYBOARD = Handlers.router.keyboard(
+    rows(Config.THEME_DESCRIPTIONS.values(), 2) + [[BTN_FAVORITES, BTN_HELP]]
+)
+Handlers.COLORS_KEYBOARD = Handlers.router.keyboard(
+    [[BTN_BRIGHTER, BTN_DARKER], [BTN_SAVE_ALL, BTN_SAVE_PALETTE], [BTN_HOME]]
+)
+Handlers.FAVORITES_KEYBOARD = Handlers.router.keyboard([[BTN_MY_COLORS, BTN_CLEAR], [BTN_HOME]])
+Handlers.FAVORITES_PAGE_KEYBOARD = Handlers.router.keyboard([[BTN_PREV_PAGE, BTN_NEXT_PAGE], [BTN_FAVORITES, BTN_HOME]])
+Handlers.CONFIRM_KEYBOARD = Handlers.router.keyboard([[BTN_CONFIRM_CLEAR, BTN_CANCEL_CLEAR], [BTN_HOME]])
+Handlers.HOME_KEYBOARD = Handlers.router.keyboard([[BTN_HOME]])
\ No newline at end of file
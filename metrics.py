@@ -0,0 +1,260 @@
+"""Метрики бота в памяти процесса.
+
+Гистограммы и счетчики с метками, кэши и текущие значения (gauge) регистрируются
+здесь и отдаются в текстовом формате Prometheus (render) или короткой сводкой
+для команды /stats (format_stats)
+"""
+import bisect
+import threading
+import time
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+
+_REGISTRY = []
+_caches = {}
+_gauges = []
+
+# Этапы запуска: фаза -> секунды от старта процесса
+_startup_origin = None
+_startup_phases = {}
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+class Counter:
+    """Счетчик с метками"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def get(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def label_values(self, label: str):
+        return {dict(key).get(label, '') for key in list(self._values)}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_format_labels(labels)} {value}')
+        return lines
+
+
+class Histogram:
+    """Гистограмма с метками (корзины накопительные, как в Prometheus)"""
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # метки -> [счетчики по корзинам (+Inf последней), сумма, количество]
+        self._series = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def summary(self, label: str):
+        """значение метки label -> (количество, среднее, оценка p95 по верхней границе корзины)"""
+        result = {}
+        for labels, (counts, total, count) in list(self._series.items()):
+            if not count:
+                continue
+            threshold = count * 0.95
+            seen = 0
+            p95 = float('inf')
+            for bound, bucket_count in zip(self.buckets, counts):
+                seen += bucket_count
+                if seen >= threshold:
+                    p95 = bound
+                    break
+            result[dict(labels).get(label, '')] = (count, total / count, p95)
+        return result
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_format_labels(labels, ("le", bound))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(labels, ("le", "+Inf"))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+HANDLER_SECONDS = Histogram('colorbot_handler_seconds', 'Время работы обработчика')
+HANDLER_ERRORS = Counter('colorbot_handler_errors_total', 'Исключения в обработчиках')
+API_SECONDS = Histogram('colorbot_api_request_seconds', 'Время успешного запроса к API цветов')
+API_ERRORS = Counter('colorbot_api_errors_total', 'Ошибки запросов к API цветов (кроме таймаутов)')
+API_TIMEOUTS = Counter('colorbot_api_timeouts_total', 'Таймауты запросов к API цветов')
+API_REJECTED = Counter('colorbot_api_rejected_total', 'Запросы, не отправленные из-за разомкнутой цепи')
+DB_SECONDS = Histogram('colorbot_db_query_seconds', 'Время SQL-запроса', DB_BUCKETS)
+DB_ERRORS = Counter('colorbot_db_errors_total', 'Ошибки SQL-запросов')
+RATE_LIMITED = Counter('colorbot_rate_limited_total',
+                       'Запросы сверх лимита частоты: queued - ждали очереди, coalesced - объединены, '
+                       'rejected - отправлены к следующему источнику')
+
+
+def track_latency(func):
+    """Декоратор обработчика: время работы и исключения с меткой handler"""
+    name = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+            if 'first_update' not in _startup_phases:
+                mark_startup('first_update')
+    return wrapper
+
+
+def startup_begin(origin: float):
+    """Точка отсчета для этапов запуска (time.perf_counter() в начале процесса)"""
+    global _startup_origin
+    _startup_origin = origin
+
+
+def mark_startup(phase: str):
+    """Отметить окончание этапа запуска (повторные отметки не учитываются)"""
+    if _startup_origin is not None and phase not in _startup_phases:
+        _startup_phases[phase] = time.perf_counter() - _startup_origin
+
+
+def startup_phases():
+    """фаза -> секунды от старта процесса, в порядке отметок"""
+    return dict(_startup_phases)
+
+
+def register_cache(name: str, cache):
+    """Кэш с атрибутами hits и misses (LRUCache, RefreshingCache, пулы prefetch)"""
+    _caches[name] = cache
+
+
+def register_gauge(name: str, help: str, func):
+    """Текущее значение, которое считается при каждом чтении метрик"""
+    _gauges.append((name, help, func))
+
+
+def cache_stats():
+    """имя -> (попадания, промахи)"""
+    return {name: (cache.hits, cache.misses) for name, cache in _caches.items()}
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+
+    stats = cache_stats()
+    for suffix, help, index in (('hits', 'Попадания в кэш', 0), ('misses', 'Промахи кэша', 1)):
+        name = f'colorbot_cache_{suffix}_total'
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} counter']
+        lines += [f'{name}{{cache="{cache}"}} {values[index]}' for cache, values in sorted(stats.items())]
+    lines += ['# HELP colorbot_cache_hit_ratio Доля попаданий', '# TYPE colorbot_cache_hit_ratio gauge']
+    for cache, (hits, misses) in sorted(stats.items()):
+        total = hits + misses
+        lines.append(f'colorbot_cache_hit_ratio{{cache="{cache}"}} {hits / total if total else 0.0}')
+
+    if _startup_phases:
+        lines += ['# HELP colorbot_startup_seconds Окончание этапа запуска от старта процесса',
+                  '# TYPE colorbot_startup_seconds gauge']
+        lines += [f'colorbot_startup_seconds{{phase="{phase}"}} {seconds}'
+                  for phase, seconds in startup_phases().items()]
+
+    for name, help, func in _gauges:
+        try:
+            value = func()
+        except Exception:
+            continue
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} gauge', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+def _ms(seconds):
+    if seconds == float('inf'):
+        return '∞'
+    return f'{seconds * 1000:.0f} мс' if seconds >= 0.01 else f'{seconds * 1000:.2g} мс'
+
+
+def format_stats() -> str:
+    """Короткая сводка для команды /stats (HTML)"""
+    text = "📊 <b>Статистика</b>\n\n<b>Обработчики</b> (вызовов, среднее, p95):\n"
+    handlers = HANDLER_SECONDS.summary('handler')
+    for handler, (count, average, p95) in sorted(handlers.items(), key=lambda item: -item[1][0] * item[1][1]):
+        errors = HANDLER_ERRORS.get(handler=handler)
+        text += f"• {handler}: {count}, {_ms(average)}, ≤{_ms(p95)}"
+        text += f", ошибок {errors}\n" if errors else "\n"
+    if not handlers:
+        text += "• пока нет данных\n"
+
+    text += "\n<b>API</b>:\n"
+    api = API_SECONDS.summary('source')
+    sources = sorted(set(api) | API_ERRORS.label_values('source')
+                     | API_TIMEOUTS.label_values('source') | API_REJECTED.label_values('source'))
+    for source in sources:
+        count, average, p95 = api.get(source, (0, 0.0, 0.0))
+        text += f"• {source}: успешно {count}"
+        if count:
+            text += f" ({_ms(average)}, p95 ≤{_ms(p95)})"
+        text += (f", ошибок {API_ERRORS.get(source=source)}, таймаутов {API_TIMEOUTS.get(source=source)}, "
+                 f"отклонено {API_REJECTED.get(source=source)}\n")
+    if not sources:
+        text += "• пока нет данных\n"
+
+    limits = sorted(RATE_LIMITED.label_values('limit'))
+    if limits:
+        text += "\n<b>Лимиты частоты</b>:\n"
+        for limit in limits:
+            outcomes = ", ".join(f"{outcome} {RATE_LIMITED.get(limit=limit, outcome=outcome)}"
+                                 for outcome in ("queued", "coalesced", "rejected")
+                                 if RATE_LIMITED.get(limit=limit, outcome=outcome))
+            text += f"• {limit}: {outcomes}\n"
+
+    text += "\n<b>База данных</b>:\n"
+    for operation, (count, average, p95) in sorted(DB_SECONDS.summary('operation').items()):
+        text += f"• {operation}: {count}, среднее {_ms(average)}, p95 ≤{_ms(p95)}\n"
+
+    phases = startup_phases()
+    if phases:
+        text += "\n<b>Запуск</b>: " + ", ".join(f"{phase} {seconds:.2f} с" for phase, seconds in phases.items()) + "\n"
+
+    text += "\n<b>Кэши</b> (попадания):\n"
+    for cache, (hits, misses) in sorted(cache_stats().items()):
+        total = hits + misses
+        ratio = f"{hits / total:.0%}" if total else "—"
+        text += f"• {cache}: {ratio} ({hits}/{total})\n"
+    return text
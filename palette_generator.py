@@ -0,0 +1,74 @@
+"""Генератор палитр по тематикам без обращения к сети.
+
+Палитры строятся в OKLCh (перцептивное пространство: равные шаги светлоты и оттенка
+выглядят равными) от цветов локальной палитры тематики по одной из схем - аналоговой,
+комплементарной или триадной. Палитры считаются пачками на NumPy, а выдаются из готового
+пула, поэтому одна палитра стоит единицы микросекунд
+"""
+import numpy as np
+import color_math
+
+# Схема -> поворот оттенка (градусы) для 5 цветов палитры относительно базового цвета
+SCHEMES = {
+    "analogous": (-40, -20, 0, 20, 40),
+    "complementary": (0, 0, 180, 180, 0),
+    "triadic": (0, 120, 240, 120, 0),
+}
+
+# Позиции палитры - от темного цвета к светлому: сдвиг светлоты и множитель хромы
+_LIGHTNESS_OFFSETS = np.array([-0.28, -0.12, 0.0, 0.14, 0.3])
+_CHROMA_FACTORS = np.array([0.8, 1.0, 1.0, 0.85, 0.45])
+
+# Цвета семян с меньшей хромой (белый, черный, серые) не годятся в базу: у них нет оттенка
+_MIN_SEED_CHROMA = 0.03
+
+
+class PaletteGenerator:
+    """Пулы сгенерированных палитр по тематикам"""
+
+    def __init__(self, seeds: dict, batch_size: int = 256, seed=None):
+        # seeds - тематика -> список HEX-цветов, от которых строятся палитры
+        self.batch_size = batch_size
+        self.generated = 0
+        self._rng = np.random.default_rng(seed)
+        self._hue_offsets = np.array(list(SCHEMES.values()), dtype=np.float64)
+        self._seeds = {}
+        for theme, colors in seeds.items():
+            rgb, valid = color_math.hex_to_rgb(colors)
+            lch = color_math.oklab_to_oklch(color_math.rgb_to_oklab(rgb[valid]))
+            chromatic = lch[lch[:, 1] >= _MIN_SEED_CHROMA]
+            if len(lch):
+                self._seeds[theme] = chromatic if len(chromatic) else lch
+        self._pools = {theme: [] for theme in self._seeds}
+
+    def generate(self, theme: str):
+        """Новая палитра из 5 цветов (None - тематика неизвестна)"""
+        pool = self._pools.get(theme)
+        if pool is None:
+            return None
+        if not pool:
+            pool.extend(self.generate_batch(theme, self.batch_size))
+        return pool.pop()
+
+    def generate_batch(self, theme: str, count: int):
+        """count палитр тематики одним вычислением на NumPy"""
+        rng = self._rng
+        seeds = self._seeds[theme]
+        base = seeds[rng.integers(len(seeds), size=count)]
+
+        # База - цвет семени с небольшим разбросом; слишком темная, светлая или серая
+        # база подтягивается к середине, иначе схему оттенков не видно
+        lightness = np.clip(base[:, 0] + rng.uniform(-0.06, 0.06, count), 0.45, 0.75)
+        chroma = np.clip(base[:, 1] * rng.uniform(0.8, 1.2, count), 0.06, 0.3)
+        hue = base[:, 2] + rng.uniform(-20, 20, count)
+        scheme = rng.integers(len(self._hue_offsets), size=count)
+        spread = rng.uniform(0.7, 1.1, count)
+
+        lch = np.empty((count, 5, 3))
+        lch[:, :, 0] = np.clip(lightness[:, None] + _LIGHTNESS_OFFSETS * spread[:, None], 0.15, 0.97)
+        lch[:, :, 1] = chroma[:, None] * _CHROMA_FACTORS
+        lch[:, :, 2] = hue[:, None] + self._hue_offsets[scheme]
+
+        colors = color_math.rgb_to_hex(color_math.oklch_to_rgb_in_gamut(lch.reshape(-1, 3)))
+        self.generated += count
+        return [colors[i:i + 5] for i in range(0, len(colors), 5)]
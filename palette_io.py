@@ -0,0 +1,284 @@
+"""Экспорт и импорт палитр: CSV, JSON и ASE (Adobe Swatch Exchange).
+
+Палитра здесь - пара (название, список HEX-цветов). Запись и чтение идут потоком:
+писатель получает палитры пачками и сразу дописывает их в файл, а читатель отдает
+палитры по одной, не загружая файл в память целиком
+"""
+import codecs
+import csv
+import io
+import json
+import math
+import re
+import struct
+
+FORMATS = ("csv", "json", "ase")
+
+_HEX_COLOR = re.compile(r"#?([0-9A-Fa-f]{6})")
+_SEPARATORS = re.compile(r"[\s,;]+")
+_READ_SIZE = 64 * 1024
+# Предел размера одной записи JSON (палитры): огромный объект не разбирается заново на каждом куске файла
+_JSON_MAX_ITEM = 1024 * 1024
+
+# Блоки ASE
+_ASE_GROUP_START = 0xC001
+_ASE_GROUP_END = 0xC002
+_ASE_COLOR = 0x0001
+_ASE_MAX_BLOCK = 64 * 1024
+# Цвета вне групп собираются в палитры по столько штук
+_ASE_LOOSE_PALETTE = 5
+
+
+def normalize_colors(colors, max_colors: int):
+    """Список цветов -> ['#RRGGBB', ...]; None, если хоть один цвет некорректен
+    или цветов нет или больше max_colors. Строка разбивается по пробелам и запятым"""
+    if isinstance(colors, str):
+        colors = [color for color in _SEPARATORS.split(colors) if color]
+    if not isinstance(colors, list) or not 0 < len(colors) <= max_colors:
+        return None
+    result = []
+    for color in colors:
+        match = _HEX_COLOR.fullmatch(color.strip()) if isinstance(color, str) else None
+        if match is None:
+            return None
+        result.append("#" + match.group(1).upper())
+    return result
+
+
+class CSVWriter:
+    """CSV: столбцы name и colors (цвета через пробел)"""
+
+    def __init__(self, file):
+        self._text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+        self._csv = csv.writer(self._text)
+        self._csv.writerow(["name", "colors"])
+
+    def write(self, palettes):
+        self._csv.writerows((name or "", " ".join(colors)) for name, colors in palettes)
+
+    def close(self):
+        self._text.flush()
+        self._text.detach()
+
+
+class JSONWriter:
+    """JSON: массив объектов {"name": ..., "colors": [...]}, по объекту на строку"""
+
+    def __init__(self, file):
+        self._file = file
+        self._first = True
+        file.write(b"[")
+
+    def write(self, palettes):
+        parts = []
+        for name, colors in palettes:
+            parts.append("\n" if self._first else ",\n")
+            parts.append(json.dumps({"name": name, "colors": colors}, ensure_ascii=False))
+            self._first = False
+        self._file.write("".join(parts).encode("utf-8"))
+
+    def close(self):
+        self._file.write(b"\n]\n")
+
+
+class ASEWriter:
+    """ASE: каждая палитра - группа с цветами RGB.
+
+    Число блоков в заголовке известно только в конце, поэтому файл должен поддерживать seek
+    """
+
+    def __init__(self, file):
+        self._file = file
+        self._start = file.tell()
+        self._blocks = 0
+        file.write(b"ASEF" + struct.pack(">HHI", 1, 0, 0))
+
+    def write(self, palettes):
+        out = bytearray()
+        for name, colors in palettes:
+            out += _ase_block(_ASE_GROUP_START, _ase_name(name or "Palette"))
+            for color in colors:
+                r, g, b = bytes.fromhex(color[1:])
+                out += _ase_block(_ASE_COLOR, _ase_name(color) + b"RGB " + struct.pack(">fffH", r / 255, g / 255, b / 255, 2))
+            out += _ase_block(_ASE_GROUP_END, b"")
+            self._blocks += len(colors) + 2
+        self._file.write(out)
+
+    def close(self):
+        end = self._file.tell()
+        self._file.seek(self._start + 8)
+        self._file.write(struct.pack(">I", self._blocks))
+        self._file.seek(end)
+
+
+_WRITERS = {"csv": CSVWriter, "json": JSONWriter, "ase": ASEWriter}
+
+
+def open_writer(fmt: str, file):
+    """Писатель формата fmt поверх двоичного файла: write(пачка палитр), затем close()"""
+    return _WRITERS[fmt](file)
+
+
+def read_palettes(fmt: str, file, max_colors: int):
+    """Палитры из двоичного файла по одной: (название, цвета) или None для некорректной записи.
+
+    Испорченный файл целиком дает ValueError
+    """
+    readers = {"csv": _read_csv, "json": _read_json, "ase": _read_ase}
+    return readers[fmt](file, max_colors)
+
+
+def _ase_name(name: str) -> bytes:
+    encoded = (name + "\0").encode("utf-16-be")
+    return struct.pack(">H", len(encoded) // 2) + encoded
+
+
+def _ase_block(kind: int, body: bytes) -> bytes:
+    return struct.pack(">HI", kind, len(body)) + body
+
+
+def _read_csv(file, max_colors):
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        for row in csv.reader(text):
+            if not row or (row[0].strip().lower() == "name" and len(row) > 1 and row[1].strip().lower() == "colors"):
+                continue
+            colors = normalize_colors(" ".join(row[1:]), max_colors)
+            yield (row[0].strip(), colors) if colors else None
+    except csv.Error as e:
+        raise ValueError(f"Некорректный CSV: {e}") from e
+    finally:
+        text.detach()
+
+
+def _read_json(file, max_colors):
+    """Объекты верхнего уровня по одному: массив палитр, JSON Lines или массив массивов цветов"""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    position = 0
+    eof = False
+    started = False
+    while True:
+        # Разделители между палитрами и скобки внешнего массива пропускаем
+        while position < len(buffer) and buffer[position] in " \t\r\n,]":
+            position += 1
+        if not started and position < len(buffer):
+            started = True
+            # Внешний массив (иначе - JSON Lines)
+            if buffer[position] == "[":
+                position += 1
+                continue
+        if position < len(buffer):
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise ValueError("Некорректный JSON")
+                item = None
+            else:
+                yield _palette_from_json(item, max_colors)
+                continue
+        elif eof:
+            return
+        # Буфер кончился или объект прочитан не целиком - дочитываем файл. Разбирать
+        # недочитанный объект заново имеет смысл, только когда пришла закрывающая скобка
+        parts = [buffer[position:]]
+        size = len(parts[0])
+        while not eof:
+            chunk = file.read(_READ_SIZE)
+            eof = not chunk
+            text = text_decoder.decode(chunk, final=eof)
+            parts.append(text)
+            size += len(text)
+            if size > _JSON_MAX_ITEM:
+                raise ValueError("Некорректный JSON: слишком большая запись")
+            if "}" in text or "]" in text:
+                break
+        buffer = "".join(parts)
+        position = 0
+
+
+def _palette_from_json(item, max_colors):
+    if isinstance(item, dict):
+        colors = normalize_colors(item.get("colors"), max_colors)
+        name = item.get("name")
+        return (str(name) if name is not None else "", colors) if colors else None
+    colors = normalize_colors(item, max_colors) if isinstance(item, list) else None
+    return ("", colors) if colors else None
+
+
+def _read_ase(file, max_colors):
+    header = file.read(12)
+    if len(header) < 12 or header[:4] != b"ASEF":
+        raise ValueError("Это не файл ASE")
+    (blocks,) = struct.unpack(">I", header[8:])
+
+    group_name = None
+    group = []
+    loose = []
+    for _ in range(blocks):
+        head = file.read(6)
+        if len(head) < 6:
+            break
+        kind, length = struct.unpack(">HI", head)
+        if length > _ASE_MAX_BLOCK:
+            raise ValueError("Слишком большой блок ASE")
+        body = file.read(length)
+        if len(body) != length:
+            raise ValueError("Некорректный ASE: файл обрывается посреди блока")
+        if kind == _ASE_GROUP_START:
+            if group_name is not None:
+                yield _ase_palette(group_name, group, max_colors)
+            try:
+                group_name, group = _ase_read_name(body), []
+            except struct.error:
+                raise ValueError("Некорректный ASE") from None
+        elif kind == _ASE_GROUP_END:
+            if group_name is not None:
+                yield _ase_palette(group_name, group, max_colors)
+            group_name, group = None, []
+        elif kind == _ASE_COLOR:
+            color = _ase_color(body)
+            if group_name is not None:
+                group.append(color)
+                continue
+            loose.append(color)
+            if len(loose) == _ASE_LOOSE_PALETTE:
+                yield _ase_palette("", loose, max_colors)
+                loose = []
+    if group_name is not None:
+        yield _ase_palette(group_name, group, max_colors)
+    if loose:
+        yield _ase_palette("", loose, max_colors)
+
+
+def _ase_read_name(body: bytes) -> str:
+    (length,) = struct.unpack_from(">H", body)
+    return body[2:2 + length * 2].decode("utf-16-be", errors="replace").rstrip("\0")
+
+
+def _ase_color(body: bytes):
+    """HEX цвета из блока ASE (None для моделей, кроме RGB и Gray)"""
+    try:
+        (length,) = struct.unpack_from(">H", body)
+        offset = 2 + length * 2
+        model = body[offset:offset + 4]
+        if model == b"RGB ":
+            values = struct.unpack_from(">fff", body, offset + 4)
+        elif model == b"Gray":
+            values = struct.unpack_from(">f", body, offset + 4) * 3
+        else:
+            return None
+    except struct.error:
+        return None
+    if not all(math.isfinite(value) for value in values):
+        return None
+    return "#" + "".join(f"{round(min(max(value, 0.0), 1.0) * 255):02X}" for value in values)
+
+
+def _ase_palette(name, colors, max_colors):
+    if None in colors:
+        return None
+    colors = normalize_colors(colors, max_colors)
+    return (name, colors) if colors else None
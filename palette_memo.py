@@ -0,0 +1,44 @@
+import metrics
+from api_client import ColorAPIClient
+from cache import LRUCache
+from config import Config
+
+
+def render_palette_message(title: str, colors) -> str:
+    """Подпись к палитре: заголовок и пронумерованные HEX-коды"""
+    lines = "".join(f"{i}. <code>{color}</code>\n" for i, color in enumerate(colors, 1))
+    return f"🎨 <b>{title}:</b>\n\n{lines}\nВыберите действие:"
+
+
+class PaletteMemo:
+    """Готовые ответы с палитрами: (палитра, действие, заголовок) -> (цвета, текст сообщения).
+
+    Действие применяется к текущей палитре пользователя, поэтому цепочка нажатий
+    ("ярче", "ярче", ...) разворачивается в цепочку записей кэша: повторные нажатия и
+    популярные палитры не пересчитывают цвета и не собирают текст заново. Палитра, которая
+    уже уперлась в 255, после "ярче" ссылается сама на себя
+    """
+
+    _entries = LRUCache(Config.PALETTE_MEMO_SIZE)
+    metrics.register_cache("palette_memo", _entries)
+
+    @staticmethod
+    def _get(colors, action, title):
+        key = (tuple(colors), action, title)
+        entry = PaletteMemo._entries.get(key)
+        if entry is None:
+            adjusted = ColorAPIClient.adjust_colors(list(colors), action) if action else list(colors)
+            entry = (tuple(adjusted), render_palette_message(title, adjusted))
+            PaletteMemo._entries.set(key, entry)
+        return entry
+
+    @staticmethod
+    def theme(colors, title: str):
+        """Текст сообщения для только что выбранной палитры"""
+        return PaletteMemo._get(colors, None, title)[1]
+
+    @staticmethod
+    def adjust(colors, action: str, title: str):
+        """(измененные цвета, текст сообщения) после действия brighter/darker"""
+        adjusted, message = PaletteMemo._get(colors, action, title)
+        return list(adjusted), message
@@ -0,0 +1,94 @@
+import mmap
+import os
+import struct
+import time
+
+# Формат файла:
+#   заголовок (magic, версия, макс. цветов в палитре, число палитр, время сохранения)
+#   по байту на палитру - сколько в ней цветов
+#   RGB-байты, по width * 3 на палитру
+_HEADER = struct.Struct('<4sBBId')
+_MAGIC = b'CPAL'
+_VERSION = 1
+
+
+class PackedPalettes:
+    """Палитры, упакованные в байты RGB; ведет себя как список списков HEX-цветов"""
+
+    def __init__(self, buffer, count: int, width: int, saved_at: float):
+        self._buffer = buffer
+        self._count = count
+        self._width = width
+        self._lengths_offset = _HEADER.size
+        self._colors_offset = _HEADER.size + count
+        self.saved_at = saved_at
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("palette index out of range")
+
+        length = self._buffer[self._lengths_offset + index]
+        start = self._colors_offset + index * self._width * 3
+        rgb = self._buffer[start:start + length * 3]
+        return [f"#{rgb[i]:02X}{rgb[i + 1]:02X}{rgb[i + 2]:02X}" for i in range(0, len(rgb), 3)]
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+
+class PaletteSnapshot:
+    """Снимок палитр на диске для быстрого старта без сети"""
+
+    @staticmethod
+    def save(path: str, palettes):
+        """Сохранить палитры (список списков HEX-цветов) атомарно"""
+        packed = []
+        for palette in palettes:
+            if not isinstance(palette, list):
+                continue
+            rgb = bytearray()
+            for color in palette:
+                if isinstance(color, str) and len(color) == 7 and color.startswith('#'):
+                    try:
+                        rgb += bytes.fromhex(color[1:])
+                    except ValueError:
+                        continue
+            if rgb:
+                packed.append(bytes(rgb))
+
+        width = min(max((len(rgb) // 3 for rgb in packed), default=0), 255)
+        body = bytearray(_HEADER.pack(_MAGIC, _VERSION, width, len(packed), time.time()))
+        body += bytes(min(len(rgb) // 3, width) for rgb in packed)
+        for rgb in packed:
+            body += rgb[:width * 3].ljust(width * 3, b'\0')
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str):
+        """Открыть снимок через mmap. None, если файла нет или он поврежден"""
+        try:
+            with open(path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if len(buffer) < _HEADER.size:
+            return None
+        magic, version, width, count, saved_at = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC or version != _VERSION:
+            return None
+        if len(buffer) < _HEADER.size + count + count * width * 3:
+            return None
+
+        return PackedPalettes(buffer, count, width, saved_at)
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from collections import deque
+
+class PalettePrefetcher:
+    """Фоновое пополнение пулов готовых палитр для каждой тематики"""
+
+    def __init__(self, fetch, themes, pool_size: int, concurrency: int,
+                 rate_per_sec: float, retry_delay: float):
+        # fetch - корутина без аргументов, возвращает список цветов или None
+        self.fetch = fetch
+        self.pool_size = pool_size
+        self.pools = {theme: deque(maxlen=pool_size) for theme in themes}
+        self.retry_delay = retry_delay
+        self.hits = 0
+        self.misses = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._interval = 1 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self._next_request_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def pop(self, theme: str):
+        """Взять готовую палитру из пула (None, если пул пуст)"""
+        pool = self.pools.get(theme)
+        self._wakeup.set()
+        if pool:
+            self.hits += 1
+            return pool.popleft()
+        self.misses += 1
+        return None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            # Пополняем пулы по кругу, чтобы все тематики заполнялись равномерно
+            missing = [
+                theme
+                for level in range(self.pool_size)
+                for theme, pool in self.pools.items()
+                if len(pool) <= level
+            ]
+            if not missing:
+                await self._wakeup.wait()
+                continue
+
+            results = await asyncio.gather(*(self._refill(theme) for theme in missing))
+            if not any(results):
+                # Источник недоступен - не долбим его в цикле
+                await asyncio.sleep(self.retry_delay)
+
+    async def _refill(self, theme: str):
+        async with self._semaphore:
+            await self._throttle()
+            try:
+                colors = await self.fetch()
+            except Exception as e:
+                print(f"Prefetch error ({theme}): {type(e).__name__}")
+                colors = None
+        if colors:
+            self.pools[theme].append(colors)
+            return True
+        return False
+
+    async def _throttle(self):
+        """Не чаще rate_per_sec запросов к источнику"""
+        now = time.monotonic()
+        start_at = max(now, self._next_request_at)
+        self._next_request_at = start_at + self._interval
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
@@ -0,0 +1,198 @@
+import asyncio
+import time
+from collections import deque
+from cache import LRUCache
+
+class CircuitBreaker:
+    """Предохранитель для внешнего источника.
+
+    closed - запросы идут как обычно, считаем долю ошибок в окне;
+    open - запросы сразу отклоняются, пока не пройдет open_seconds;
+    half_open - пропускаем один пробный запрос: успех закрывает цепь, ошибка снова открывает
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_rate: float, min_requests: int, window: int, open_seconds: float):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.state = CircuitBreaker.CLOSED
+        self._results = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_started_at = None
+
+    def allow(self) -> bool:
+        """Можно ли сейчас отправить запрос"""
+        now = time.monotonic()
+        if self.state == CircuitBreaker.OPEN:
+            if now - self._opened_at < self.open_seconds:
+                return False
+            self.state = CircuitBreaker.HALF_OPEN
+            self._probe_started_at = None
+
+        if self.state == CircuitBreaker.HALF_OPEN:
+            # Пробный запрос уже идет (если он потерялся - через open_seconds пускаем новый)
+            if self._probe_started_at is not None and now - self._probe_started_at < self.open_seconds:
+                return False
+            self._probe_started_at = now
+        return True
+
+    def release_probe(self):
+        """Пробный запрос отменен без результата - следующий запрос может стать пробным"""
+        if self.state == CircuitBreaker.HALF_OPEN:
+            self._probe_started_at = None
+
+    def record_success(self):
+        if self.state == CircuitBreaker.HALF_OPEN:
+            self.state = CircuitBreaker.CLOSED
+            self._results.clear()
+        self._results.append(True)
+
+    def record_failure(self):
+        if self.state == CircuitBreaker.HALF_OPEN:
+            self._open()
+            return
+        self._results.append(False)
+        failures = self._results.count(False)
+        if len(self._results) >= self.min_requests and failures / len(self._results) >= self.failure_rate:
+            self._open()
+
+    def _open(self):
+        self.state = CircuitBreaker.OPEN
+        self._opened_at = time.monotonic()
+        self._results.clear()
+
+
+class LatencyTracker:
+    """Скользящее окно задержек источника и таймаут, подстроенный под них"""
+
+    def __init__(self, window: int, percentile: float, multiplier: float,
+                 min_timeout: float, min_samples: int = 5):
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def value(self, percentile: float):
+        """Перцентиль задержки в секундах (None, если данных нет)"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+    def timeout(self, max_timeout: float) -> float:
+        """Таймаут: перцентиль * множитель в пределах [min_timeout, max_timeout]"""
+        if len(self._samples) < self.min_samples:
+            return max_timeout
+        adaptive = self.value(self.percentile) * self.multiplier
+        return max(self.min_timeout, min(adaptive, max_timeout))
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, в запасе не больше burst.
+
+    reserve раздает места по порядку: токены могут уйти в минус, и каждый следующий
+    запрос ждет на 1/rate дольше предыдущего - очередь честная (FIFO) без списка ожидающих
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def reserve(self, max_wait: float = float('inf')):
+        """Занять токен: секунды до своей очереди (0 - сразу) или None, если ждать дольше max_wait"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+    def refund(self):
+        """Вернуть занятый токен, если запрос так и не был отправлен"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class RateLimiter:
+    """Корзины токенов по ключу (например, по пользователю).
+
+    Хранятся только недавно активные ключи: вытесненная корзина просто создается заново полной
+    """
+
+    def __init__(self, rate: float, burst: int, maxsize: int):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = LRUCache(maxsize, track_stats=False)
+
+    def reserve(self, key, max_wait: float = float('inf')):
+        """Как TokenBucket.reserve; при rate <= 0 ограничения нет"""
+        if self.rate <= 0:
+            return 0.0
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets.set(key, bucket)
+        return bucket.reserve(max_wait)
+
+
+class Coalescer:
+    """Отложенные запросы по ключу, из которых выполняется только последний.
+
+    Пока отложенный запрос ждет своей очереди, новые запросы с тем же ключом лишь
+    заменяют его: через delay выполняется один вызов с самыми свежими аргументами
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._tasks = {}
+
+    def __contains__(self, key):
+        return key in self._pending
+
+    def submit(self, key, delay: float, func, *args):
+        """Выполнить func(*args) через delay секунд (или заменить уже ожидающий запрос)"""
+        self._pending[key] = (func, args)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key, delay))
+
+    def replace(self, key, func, *args) -> bool:
+        """Заменить ожидающий запрос; False - ожидающего запроса нет"""
+        if key not in self._pending:
+            return False
+        self._pending[key] = (func, args)
+        return True
+
+    def cancel(self, key):
+        task = self._tasks.get(key)
+        if task is not None:
+            task.cancel()
+
+    async def close(self):
+        """Отменить все ожидающие запросы"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, key, delay: float):
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            del self._tasks[key]
+            func, args = self._pending.pop(key)
+        try:
+            await func(*args)
+        except Exception as e:
+            print(f"Deferred request error: {type(e).__name__}: {e}")
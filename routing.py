@@ -0,0 +1,56 @@
+import re
+from telegram import ReplyKeyboardMarkup
+
+
+def rows(labels, width: int):
+    """Разбить подписи кнопок на ряды по width штук"""
+    labels = list(labels)
+    return [labels[i:i + width] for i in range(0, len(labels), width)]
+
+
+class Router:
+    """Таблица маршрутов, собирается один раз при загрузке обработчиков.
+
+    Кнопка (точный текст) -> обработчик с заранее заданными аргументами - поиск в словаре;
+    шаблоны (например HEX-код) проверяются, только если кнопка не нашлась;
+    команды регистрируются в приложении из того же реестра
+    """
+
+    def __init__(self):
+        self._buttons = {}
+        self._patterns = []
+        self.commands = {}
+
+    def button(self, label: str, handler, *args):
+        """Кнопка label вызывает handler(update, context, *args)"""
+        if label in self._buttons:
+            raise ValueError(f"Кнопка {label!r} уже зарегистрирована")
+        self._buttons[label] = (handler, args)
+
+    def pattern(self, regex: str, handler):
+        """Текст, целиком подходящий под regex, вызывает handler(update, context, text)"""
+        self._patterns.append((re.compile(regex), handler))
+
+    def command(self, name: str, handler):
+        self.commands[name] = handler
+
+    def keyboard(self, layout):
+        """ReplyKeyboardMarkup из рядов подписей; каждая кнопка должна иметь маршрут"""
+        missing = [label for row in layout for label in row if label not in self._buttons]
+        if missing:
+            raise ValueError(f"Нет маршрутов для кнопок: {', '.join(missing)}")
+        return ReplyKeyboardMarkup(layout, resize_keyboard=True)
+
+    async def dispatch(self, update, context):
+        """Вызвать обработчик для текста сообщения; False - маршрут не найден"""
+        text = update.message.text
+        route = self._buttons.get(text)
+        if route is not None:
+            handler, args = route
+            await handler(update, context, *args)
+            return True
+        for regex, handler in self._patterns:
+            if regex.fullmatch(text):
+                await handler(update, context, text)
+                return True
+        return False
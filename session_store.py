@@ -0,0 +1,227 @@
+import asyncio
+import struct
+import time
+from datetime import datetime, timedelta
+import metrics
+from cache import LRUCache
+from config import Config
+from async_database import AsyncDatabase
+
+_NO_THEME = 255
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _pack_key(key):
+    """Ключ страницы избранного (added_at, id) -> (микросекунды, id)"""
+    if key is None:
+        return 0, 0
+    added_at, row_id = key
+    return (added_at - _EPOCH) // _MICROSECOND, row_id
+
+
+def _unpack_key(microseconds, row_id):
+    if not row_id:
+        return None
+    return _EPOCH + timedelta(microseconds=microseconds), row_id
+
+
+class UserSession:
+    """Состояние диалога пользователя: выбранная тема, текущие цвета
+    и открытая страница избранного.
+
+    В хранилище лежит в упакованном виде: версия, номер темы, число цветов, RGB-байты
+    и блок страницы - номер и ключи первого и последнего цвета на ней
+    (5 цветов - 44 байта)
+    """
+
+    VERSION = 2
+    _HEADER = struct.Struct('BBB')
+    _PAGE = struct.Struct('<HqIqI')
+
+    __slots__ = ('theme', 'colors', 'page', 'page_first', 'page_last')
+
+    def __init__(self, theme: str = None, colors: list = None,
+                 page: int = 0, page_first=None, page_last=None):
+        self.theme = theme
+        self.colors = colors or []
+        # Страница избранного (0 - не открыта) и ее граничные ключи (added_at, id)
+        self.page = page
+        self.page_first = page_first
+        self.page_last = page_last
+
+    @property
+    def theme_desc(self):
+        return Config.THEME_DESCRIPTIONS.get(self.theme, 'темы')
+
+    def to_bytes(self) -> bytes:
+        theme_index = Config.THEMES.index(self.theme) if self.theme in Config.THEMES else _NO_THEME
+        rgb = bytearray()
+        for color in self.colors[:255]:
+            if isinstance(color, str) and len(color) == 7:
+                try:
+                    rgb += bytes.fromhex(color[1:])
+                except ValueError:
+                    continue
+        page = self._PAGE.pack(min(self.page, 65535), *_pack_key(self.page_first), *_pack_key(self.page_last))
+        return self._HEADER.pack(UserSession.VERSION, theme_index, len(rgb) // 3) + bytes(rgb) + page
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        version, theme_index, count = cls._HEADER.unpack_from(data)
+        # Версия 1 - без блока страницы
+        if version not in (1, UserSession.VERSION):
+            return None
+        theme = Config.THEMES[theme_index] if theme_index < len(Config.THEMES) else None
+        offset = cls._HEADER.size
+        rgb = data[offset:offset + count * 3]
+        colors = [f"#{rgb[i]:02X}{rgb[i + 1]:02X}{rgb[i + 2]:02X}" for i in range(0, len(rgb), 3)]
+        session = cls(theme, colors)
+        offset += count * 3
+        if version >= 2 and len(data) >= offset + cls._PAGE.size:
+            page, first_us, first_id, last_us, last_id = cls._PAGE.unpack_from(data, offset)
+            session.page = page
+            session.page_first = _unpack_key(first_us, first_id)
+            session.page_last = _unpack_key(last_us, last_id)
+        return session
+
+
+class MemorySessionStore:
+    """Состояния в памяти процесса: ограниченный LRU с временем жизни записей"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.ttl = ttl
+        self._cache = LRUCache(maxsize)
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get(self, telegram_id):
+        entry = self._cache.get(telegram_id)
+        if entry is None:
+            return None
+        data, expires_at = entry
+        if expires_at <= time.time():
+            self._cache.pop(telegram_id)
+            return None
+        return UserSession.from_bytes(data)
+
+    async def set(self, telegram_id, session: UserSession):
+        self._cache.set(telegram_id, (session.to_bytes(), time.time() + self.ttl))
+
+    async def delete(self, telegram_id):
+        self._cache.pop(telegram_id)
+
+
+class SQLiteSessionStore(MemorySessionStore):
+    """Состояния в SQLite, общие для нескольких копий бота.
+
+    Запись отложенная: изменения копятся в памяти и сбрасываются в базу пачкой
+    раз в flush_interval секунд, так что нажатие кнопки не ждет базу.
+    Локальный LRU отвечает на чтения недавно активных пользователей
+    """
+
+    def __init__(self, maxsize: int, ttl: float, local_ttl: float,
+                 flush_interval: float, flush_batch: int, purge_interval: float):
+        super().__init__(maxsize, ttl)
+        self.local_ttl = local_ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.purge_interval = purge_interval
+        self._dirty = {}
+        self._flush_now = None
+        self._task = None
+        self._last_purge = 0.0
+
+    async def start(self):
+        if self._task is None:
+            self._flush_now = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def get(self, telegram_id):
+        # Еще не записанное в базу - самое свежее
+        if telegram_id in self._dirty:
+            data, _ = self._dirty[telegram_id]
+            return UserSession.from_bytes(data) if data is not None else None
+
+        entry = self._cache.get(telegram_id)
+        now = time.time()
+        if entry is not None and entry[1] > now:
+            return UserSession.from_bytes(entry[0]) if entry[0] is not None else None
+
+        data = await AsyncDatabase.load_session(telegram_id, now)
+        self._cache.set(telegram_id, (data, now + self.local_ttl))
+        return UserSession.from_bytes(data) if data is not None else None
+
+    async def set(self, telegram_id, session: UserSession):
+        data = session.to_bytes()
+        now = time.time()
+        self._dirty[telegram_id] = (data, now + self.ttl)
+        self._cache.set(telegram_id, (data, now + self.local_ttl))
+        self._schedule_flush()
+
+    async def delete(self, telegram_id):
+        self._dirty[telegram_id] = (None, None)
+        self._cache.set(telegram_id, (None, time.time() + self.local_ttl))
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if len(self._dirty) >= self.flush_batch and self._flush_now is not None:
+            self._flush_now.set()
+
+    async def flush(self):
+        """Записать накопленные изменения одной транзакцией"""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        rows = [(telegram_id, data, expires_at) for telegram_id, (data, expires_at) in batch.items()]
+        if not await AsyncDatabase.save_sessions(rows):
+            # Не удалось - вернем в очередь, не затирая более свежие изменения
+            for telegram_id, value in batch.items():
+                self._dirty.setdefault(telegram_id, value)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+                now = time.time()
+                if now - self._last_purge >= self.purge_interval:
+                    self._last_purge = now
+                    await AsyncDatabase.purge_sessions(now)
+            except Exception as e:
+                print(f"Ошибка при записи сессий: {type(e).__name__}")
+
+
+def create_session_store():
+    """Хранилище состояний по настройке Config.SESSION_BACKEND"""
+    if Config.SESSION_BACKEND == "sqlite":
+        store = SQLiteSessionStore(
+            maxsize=Config.SESSION_MAX_ENTRIES,
+            ttl=Config.SESSION_TTL,
+            local_ttl=Config.SESSION_LOCAL_TTL,
+            flush_interval=Config.SESSION_FLUSH_INTERVAL,
+            flush_batch=Config.SESSION_FLUSH_BATCH,
+            purge_interval=Config.SESSION_PURGE_INTERVAL
+        )
+    else:
+        store = MemorySessionStore(maxsize=Config.SESSION_MAX_ENTRIES, ttl=Config.SESSION_TTL)
+    metrics.register_cache("sessions", store._cache)
+    return store
@@ -0,0 +1,84 @@
+import asyncio
+import struct
+import zlib
+import numpy as np
+import color_math
+import metrics
+from cache import LRUCache
+from config import Config
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def render_palette_png(colors, width: int = 800, height: int = 200) -> bytes:
+    """PNG с полосами цветов палитры слева направо.
+
+    Картинка собирается целиком в NumPy без попиксельного рисования: первая строка -
+    np.repeat цветов по ширинам полос, остальные строки такие же и кодируются
+    фильтром Up (разница с предыдущей строкой, то есть нули), поэтому zlib почти
+    ничего не делает
+    """
+    rgb, valid = color_math.hex_to_rgb(list(colors))
+    rgb = rgb[valid]
+    if len(rgb) == 0:
+        raise ValueError("Нет корректных цветов для картинки")
+
+    # Ширины полос отличаются не больше чем на пиксель
+    edges = np.linspace(0, width, len(rgb) + 1).round().astype(np.int64)
+    row = np.repeat(rgb, np.diff(edges), axis=0)
+
+    # Каждая строка PNG начинается с байта фильтра: 0 - без фильтра, 2 - Up
+    scanlines = np.zeros((height, 1 + width * 3), dtype=np.uint8)
+    scanlines[0, 1:] = row.reshape(-1)
+    scanlines[1:, 0] = 2
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)  # 8 бит, RGB
+    return (
+        _PNG_SIGNATURE
+        + _png_chunk(b'IHDR', header)
+        + _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), Config.SWATCH_COMPRESSION))
+        + _png_chunk(b'IEND', b'')
+    )
+
+
+class SwatchCache:
+    """Картинки палитр, адресуемые по набору цветов.
+
+    Для каждой палитры хранится готовый PNG, а после первой отправки - file_id,
+    который вернул Telegram: повторная палитра уходит по file_id без отрисовки и загрузки
+    """
+
+    _images = LRUCache(Config.SWATCH_CACHE_SIZE)
+    _file_ids = LRUCache(Config.SWATCH_FILE_ID_CACHE_SIZE)
+    metrics.register_cache("swatch_images", _images)
+    metrics.register_cache("swatch_file_ids", _file_ids)
+
+    @staticmethod
+    def key(colors):
+        return tuple(color.upper() for color in colors)
+
+    @staticmethod
+    def get_file_id(colors):
+        return SwatchCache._file_ids.get(SwatchCache.key(colors))
+
+    @staticmethod
+    def set_file_id(colors, file_id):
+        SwatchCache._file_ids.set(SwatchCache.key(colors), file_id)
+
+    @staticmethod
+    def forget_file_id(colors):
+        SwatchCache._file_ids.pop(SwatchCache.key(colors))
+
+    @staticmethod
+    async def get_image(colors):
+        """PNG палитры (рисуется в отдельном потоке и только при промахе кэша)"""
+        key = SwatchCache.key(colors)
+        image = SwatchCache._images.get(key)
+        if image is None:
+            image = await asyncio.to_thread(render_palette_png, key, Config.SWATCH_WIDTH, Config.SWATCH_HEIGHT)
+            SwatchCache._images.set(key, image)
+        return image
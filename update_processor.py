@@ -0,0 +1,105 @@
+import asyncio
+import contextvars
+import logging
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Слот воркера, который держит текущий обработчик (None - вне ChatShardedUpdateProcessor)
+_worker_slot = contextvars.ContextVar('worker_slot', default=None)
+
+
+async def sleep_without_slot(delay: float):
+    """asyncio.sleep, на время которого слот воркера отдается другим чатам.
+
+    Порядок внутри чата сохраняется: следующие обновления чата по-прежнему ждут этот обработчик
+    """
+    slots = _worker_slot.get()
+    if slots is None:
+        await asyncio.sleep(delay)
+        return
+    slots.release()
+    try:
+        await asyncio.sleep(delay)
+    finally:
+        # Слот возвращаем и при отмене: его отпустит async with в _run
+        await asyncio.shield(slots.acquire())
+
+
+class ChatShardedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка внутри чата.
+
+    Обновления разных чатов обрабатываются одновременно (не больше workers за раз),
+    а обновления одного чата - строго по очереди: тема -> ярче -> добавить все.
+    Если в обработке больше queue_limit обновлений, прием новых приостанавливается.
+
+    Сам прием идет последовательно (max_concurrent_updates=1): do_process_update
+    только ставит обновление в очередь чата и сразу возвращает управление.
+    Отложенную работу обработчики ставят в ту же очередь через enqueue
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        super().__init__(max_concurrent_updates=1)
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self._tails = {}
+        self._tasks = set()
+        self._slots = None
+        self._has_space = None
+
+    async def initialize(self):
+        self._slots = asyncio.Semaphore(self.workers)
+        self._has_space = asyncio.Event()
+
+    async def shutdown(self):
+        await self.join()
+
+    async def join(self):
+        """Дождаться обработки уже принятых обновлений"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def do_process_update(self, update, coroutine):
+        # Back-pressure: пока очередь переполнена, новые обновления не забираем
+        while self.pending >= self.queue_limit:
+            self._has_space.clear()
+            await self._has_space.wait()
+
+        self.enqueue(update, coroutine)
+
+    def enqueue(self, update, coroutine):
+        """Выполнить coroutine в очереди чата update - после уже принятых обновлений чата"""
+        key = self._shard_key(update)
+        task = asyncio.create_task(self._run(key, self._tails.get(key), coroutine))
+        self._tails[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.pending += 1
+
+    async def _run(self, key, previous, coroutine):
+        try:
+            if previous is not None:
+                # Ждем предыдущее обновление этого чата (его ошибки нас не касаются)
+                await asyncio.wait([previous])
+            async with self._slots:
+                _worker_slot.set(self._slots)
+                await coroutine
+        except Exception:
+            logger.exception("Ошибка при обработке обновления")
+        finally:
+            self.pending -= 1
+            self._has_space.set()
+            if self._tails.get(key) is asyncio.current_task():
+                del self._tails[key]
+
+    @staticmethod
+    def _shard_key(update):
+        if isinstance(update, Update):
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+            if update.effective_user is not None:
+                return update.effective_user.id
+        # Без чата порядок не важен
+        return id(update)
@@ -0,0 +1,133 @@
+import asyncio
+import hmac
+import logging
+import signal
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+async def handle_metrics(request: web.Request):
+    """Метрики в текстовом формате Prometheus"""
+    return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(listen: str, port: int):
+    """Отдельный сервер /metrics (для режима polling)"""
+    web_app = web.Application()
+    web_app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port).start()
+    return runner
+
+
+class WebhookServer:
+    """Встроенный HTTP-сервер (aiohttp) для приема обновлений от Telegram.
+
+    Сервер не хранит состояния, поэтому несколько копий бота можно поставить
+    за балансировщиком с одним общим адресом webhook
+    """
+
+    def __init__(self, app: Application, path: str, secret_token: str, listen: str, port: int):
+        # Без секрета любой, кто узнал адрес, может прислать обновление от имени любого пользователя
+        if not secret_token:
+            raise ValueError("Для режима webhook нужен WEBHOOK_SECRET")
+        self.app = app
+        self.path = path
+        self.secret_token = secret_token
+        self.listen = listen
+        self.port = port
+        self.web_app = web.Application()
+        self.web_app.router.add_post(path, self.handle_update)
+        self.web_app.router.add_get('/healthz', self.handle_health)
+        self.web_app.router.add_get('/metrics', handle_metrics)
+        self._runner = None
+
+    async def handle_update(self, request: web.Request):
+        """Принять обновление и поставить его в очередь приложения"""
+        received = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(received, self.secret_token):
+            return web.Response(status=403)
+
+        # Очередь переполнена - Telegram повторит доставку позже
+        if self.app.update_queue.qsize() >= Config.UPDATE_QUEUE_LIMIT:
+            return web.Response(status=503)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.app.bot)
+        except Exception:
+            return web.Response(status=400)
+        if update is None:
+            return web.Response(status=400)
+
+        await self.app.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request):
+        return web.json_response({"ok": True, "queue": self.app.update_queue.qsize()})
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        # port=0 - свободный порт, выбранный системой (для тестов)
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def run_webhook(app: Application):
+    """Запуск бота в режиме webhook (вместо run_polling)"""
+    server = WebhookServer(
+        app,
+        path=Config.WEBHOOK_PATH,
+        secret_token=Config.WEBHOOK_SECRET,
+        listen=Config.WEBHOOK_LISTEN,
+        port=Config.WEBHOOK_PORT
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        await server.start()
+
+        # Адрес регистрирует одна копия (или деплой), остальные только принимают запросы
+        if Config.WEBHOOK_REGISTER and Config.WEBHOOK_URL:
+            await app.bot.set_webhook(
+                url=Config.WEBHOOK_URL.rstrip('/') + Config.WEBHOOK_PATH,
+                secret_token=Config.WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            )
+        logger.info("Webhook слушает %s:%s%s", Config.WEBHOOK_LISTEN, Config.WEBHOOK_PORT, Config.WEBHOOK_PATH)
+
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if app.running:
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)